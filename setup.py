@@ -3,14 +3,18 @@ import pathlib
 import sys
 
 sys.path.insert(0, str(pathlib.Path(__file__).parent / "src"))
-from setuptools_github import tools  # noqa E402
+from setuptools_github import build_meta  # noqa E402
 from setuptools import setup, find_namespace_packages  # noqa E402
 
 
 PROOT = pathlib.Path(__file__).parent
+PATHS = [PROOT / "README.md"]
+OUTDIR = PROOT / "build" / "rendered"
 
 
-GDATA = tools.process(
+# build_meta.process is tools.process, run once per build (the pyproject.toml
+# build-backend is setuptools_github.build_meta)
+GDATA = build_meta.process(
     # versionfile containing the __version__ / __hash__ module variables
     # (they will be update during build)
     version_file=PROOT / "src/setuptools_github/__init__.py",
@@ -21,9 +25,10 @@ GDATA = tools.process(
 
     # a list of files, processed using jinja2
     # where fixers (defined below) will replace text in `paths
-    paths=[
-        PROOT / "README.md",
-    ],
+    paths=PATHS,
+    # the rendered paths are written in outdir (the sources are left
+    # untouched), re-rendered only when their source or GDATA change
+    outdir=OUTDIR,
     # fixers replacements are key:value pairs.
     # key might be a literal string (replaced with value) or a
     # string starting with `re:`, in that case key and value are
@@ -39,6 +44,8 @@ GDATA = tools.process(
     #                                                for beta/0.3.7 branch)
     #       'workflow': 'master' <- workflow name (github)
     #   }
+    #   and the lazily computed ctx.last_tag, ctx.commit_count, ctx.changelog,
+    #   ctx.contributors and ctx.dirty (see tools.CONTEXT_PROVIDERS)
     fixers={
         # for the github actions
         "re:(https://github.com/.+/actions/workflows/)(master)(.yml/badge.svg)": (
@@ -58,6 +65,12 @@ GDATA = tools.process(
 )
 
 
+# (the get_requires_for_build_* hooks don't render, see build_meta)
+README = OUTDIR / "README.md"
+if not README.exists():
+    README = PROOT / "README.md"
+
+
 setup(
     name="setuptools-github",
     version=GDATA["version"],
@@ -65,7 +78,7 @@ setup(
     packages=find_namespace_packages(where="src"),
     package_dir={"setuptools_github": "src/setuptools_github"},
     description="supports github releases",
-    long_description=(PROOT / "README.md").read_text(),
+    long_description=README.read_text(),
     long_description_content_type="text/markdown",
     install_requires=[
         "setuptools",
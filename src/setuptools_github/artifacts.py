@@ -0,0 +1,89 @@
+"""reuses the wheels built from the same package sources
+
+The wheels are stored in a local cache keyed on the package tree hash
+(see scm.GitRepo.tree_hash) and the version: a commit touching other
+packages (or only the history) doesn't trigger a new build.
+
+    wheel, reused = artifacts.build_wheel("src/pkg/__init__.py")
+
+The cache is $SETUPTOOLS_GITHUB_CACHE (or ~/.cache/setuptools-github).
+"""
+from __future__ import annotations
+
+import os
+from pathlib import Path
+from typing import Callable
+
+from . import scm, tools
+
+CACHE_ENV = "SETUPTOOLS_GITHUB_CACHE"
+
+# a builder gets the project and output dirs, and returns the wheel path
+Builder = Callable[[Path, Path], Path]
+
+
+def cache_dir() -> Path:
+    if value := os.getenv(CACHE_ENV):
+        return Path(value)
+    return Path("~/.cache/setuptools-github").expanduser()
+
+
+def pip_wheel(project: Path, outdir: Path) -> Path:
+    "the default builder (pip wheel, no dependencies)"
+    import subprocess
+    import sys
+
+    subprocess.check_call(  # noqa: S603
+        [sys.executable, "-m", "pip", "wheel", "--no-deps", "-w", outdir, project]
+    )
+    wheels = sorted(outdir.glob("*.whl"), key=lambda p: p.stat().st_mtime)
+    if not wheels:
+        raise tools.ToolsError(f"no wheel built for {project}")
+    return wheels[-1]
+
+
+def build_wheel(
+    version_file: str | Path,
+    project: str | Path | None = None,
+    outdir: str | Path = "dist",
+    github_dump: str | None = None,
+    builder: Builder | None = None,
+    cache: Path | None = None,
+) -> tuple[Path, bool]:
+    """builds (or reuses from the cache) the wheel for version_file package
+
+    Args:
+        version_file: the package version file
+        project: the project dir (default to the version_file repo workdir)
+        outdir: where the wheel is placed
+        github_dump: the os.getenv("GITHUB_DUMP") value
+        builder: the build function (default to pip_wheel)
+        cache: the cache dir (default to cache_dir())
+
+    Returns:
+        (Path, bool): the wheel path (in outdir) and True if it was reused
+    """
+    from shutil import copy2
+    from tempfile import TemporaryDirectory
+
+    version_file = Path(version_file).absolute()
+    repo = scm.lookup(version_file.parent)
+    if not repo:
+        raise scm.InvalidGitRepoError(f"no git repo for {version_file}")
+
+    # the tree hash is computed before the build touches version_file
+    data = tools.get_data(version_file, github_dump, repo=repo, tree_hash=True)[0]
+    slot = (cache or cache_dir()) / f"{data['tree']}-{data['version']}"
+
+    outdir = Path(outdir)
+    outdir.mkdir(parents=True, exist_ok=True)
+    if wheels := sorted(slot.glob("*.whl")):
+        return Path(copy2(wheels[0], outdir)), True
+
+    with TemporaryDirectory() as tmpdir:
+        wheel = (builder or pip_wheel)(Path(project or repo.workdir), Path(tmpdir))
+        slot.mkdir(parents=True, exist_ok=True)
+        # (a concurrent build never sees a partial wheel)
+        tmp = copy2(wheel, slot / f"{wheel.name}.tmp")
+        Path(tmp).replace(slot / wheel.name)
+        return Path(copy2(wheel, outdir)), False
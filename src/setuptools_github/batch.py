@@ -0,0 +1,66 @@
+"""run tools.get_data (or tools.process) over many version files
+
+The repos are discovered once (sharing a scm.lookup cache) in the calling
+process, the version files are then handled by a pool of worker processes:
+each worker runs its git commands serially, so the number of concurrent
+git processes is bounded by the number of workers.
+
+    for result in batch.get_data_many(["a/src/a/__init__.py", ...]):
+        print(result["version_file"], result["data"]["version"])
+"""
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Any, Iterable, Iterator
+
+from . import scm, tools
+
+
+def _run(
+    version_file: Path,
+    repo: scm.GitRepo | None,
+    github_dump: str | None,
+    process: bool,
+) -> dict[str, Any]:
+    result: dict[str, Any] = {"version_file": str(version_file)}
+    try:
+        if process:
+            result["data"] = tools.process(version_file, github_dump, repo=repo)
+        else:
+            result["data"] = tools.get_data(version_file, github_dump, repo=repo)[0]
+    except Exception as exc:
+        result["error"] = f"{exc.__class__.__name__}: {exc}"
+    return result
+
+
+def get_data_many(
+    version_files: Iterable[str | Path],
+    github_dump: str | None = None,
+    process: bool = False,
+    workers: int | None = None,
+) -> Iterator[dict[str, Any]]:
+    """yields the tools.get_data results (in completion order)
+
+    Args:
+        version_files: the version files (each with a __version__ variable)
+        github_dump: the os.getenv("GITHUB_DUMP") value
+        process: run tools.process instead (updating the version files)
+        workers: the max number of worker processes (and git processes)
+
+    Yields:
+        dict: {"version_file": ..., "data": ...} or
+              {"version_file": ..., "error": "..."} on failure
+    """
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    cache: dict[Path, scm.GitRepo | None] = {}
+    jobs = [
+        (path, scm.lookup(path.absolute().parent, cache))
+        for path in (Path(p) for p in version_files)
+    ]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(_run, path, repo, github_dump, process) for path, repo in jobs
+        ]
+        for future in as_completed(futures):
+            yield future.result()
@@ -0,0 +1,223 @@
+"""a PEP 517 backend (wrapping setuptools.build_meta) computing the version once
+
+In pyproject.toml:
+
+    [build-system]
+    requires = ["setuptools", "setuptools-github"]
+    build-backend = "setuptools_github.build_meta"
+
+and in setup.py (same arguments as tools.process):
+
+    from setuptools_github import build_meta
+
+    data = build_meta.process(version_file, os.getenv("GITHUB_DUMP"))
+    setup(version=data["version"], ...)
+
+A build calls many hooks, each evaluating setup.py (often in a new process).
+The get_requires_for_build_* hooks start the build, creating the handoff
+file (in the git directory or $SETUPTOOLS_GITHUB_HANDOFF), and don't need the
+version: process returns a placeholder without running git or touching any
+file. The next hooks run tools.process once, sharing the result through the
+handoff file (keyed on the process arguments and HEAD) that the build_*
+hooks remove at the end.
+
+The frontend (pip, build) runs each hook in a child process: the handoff
+belongs to the frontend pid (the hooks parent) and it's used only by its
+children, a handoff left by an interrupted build (eg. pip resolving only the
+metadata) is ignored by the others and removed once its frontend is gone.
+
+Outside a build (eg. python setup.py sdist) process is tools.process.
+"""
+from __future__ import annotations
+
+import os
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from typing import Any, Callable
+
+HANDOFF_ENV = "SETUPTOOLS_GITHUB_HANDOFF"
+HANDOFF_NAME = "setuptools-github-handoff.json"
+# set while running the get_requires_for_build_* hooks
+DEFER_ENV = "SETUPTOOLS_GITHUB_DEFER"
+
+# the setuptools.build_meta hooks passed through as they are
+HOOKS = {"prepare_metadata_for_build_wheel", "prepare_metadata_for_build_editable"}
+
+
+def handoff_path(path: str | Path) -> Path | None:
+    "the handoff file for the project at path (None outside a git repo)"
+    from . import scm
+
+    if value := os.getenv(HANDOFF_ENV):
+        return Path(value)
+    if not (repo := scm.lookup(Path(path).absolute())):
+        return None
+    return scm.DiskBackend(repo).gitdir / HANDOFF_NAME
+
+
+def owner_alive(pid: int) -> bool:
+    "True if the (frontend) process pid is still running"
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass  # (eg. not ours)
+    return True
+
+
+def read_handoff(handoff: Path | None) -> dict[str, Any] | None:
+    "the handoff entries of the build running this process (None if not in a build)"
+    import json
+
+    if not handoff:
+        return None
+    try:
+        content = json.loads(handoff.read_text())
+        owner, entries = content["owner"], content["entries"]
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+    if owner == os.getppid():
+        return entries
+    if not (isinstance(owner, int) and owner_alive(owner)):
+        handoff.unlink(missing_ok=True)
+    return None
+
+
+def write_handoff(handoff: Path, entries: dict[str, Any]) -> None:
+    import json
+
+    tmp = handoff.with_suffix(f".{os.getpid()}.tmp")
+    tmp.write_text(json.dumps({"owner": os.getppid(), "entries": entries}))
+    tmp.replace(handoff)
+
+
+def head_state(path: str | Path) -> list[str | None]:
+    "the HEAD (ref and sha) of the repo containing path, read from disk"
+    from . import scm
+
+    if not (repo := scm.lookup(Path(path).absolute())):
+        return [None, None]
+    backend = scm.DiskBackend(repo)
+    txt = (backend.gitdir / "HEAD").read_text().strip()
+    return [txt, backend.resolve(txt[4:].strip()) if txt.startswith("ref:") else txt]
+
+
+def process(
+    version_file: str | Path,
+    github_dump: str | None = None,
+    record: str | Path = "_build.py",
+    paths: str | Path | list[str | Path] | None = None,
+    fixers: dict[str, str] | None = None,
+    abort: bool = True,
+    local_build: bool = False,
+    tree_hash: bool = False,
+    stable: bool = False,
+    outdir: str | Path | None = None,
+    ceiling: str | Path | None = None,
+    use_daemon: bool = False,
+) -> dict[str, Any]:
+    "tools.process, run once per build (see the module docstring)"
+    import json
+
+    from . import tools
+
+    if os.getenv(DEFER_ENV):
+        version = tools.get_module_var(version_file, "__version__", abort=False)
+        keys = ["branch", "build", "current", "ref", "runid", "sha", "workflow"]
+        return {**dict.fromkeys(keys), "version": version or "0.0.0"}
+
+    # (the same files give the same key, whatever the cwd or spelling)
+    version_file = Path(os.path.abspath(version_file))
+    key = json.dumps(
+        [
+            str(version_file),
+            github_dump,
+            os.path.abspath(version_file.parent / record) if record else None,
+            [os.path.abspath(p) for p in tools.list_of_paths(paths)],
+            fixers,
+            abort,
+            local_build,
+            tree_hash,
+            stable,
+            os.path.abspath(outdir) if outdir else None,
+            os.path.abspath(ceiling) if ceiling else None,
+            head_state(version_file.parent),
+        ]
+    )
+    handoff = handoff_path(version_file.parent)
+    entries = read_handoff(handoff)
+    if entries and key in entries:
+        return entries[key]
+
+    data = tools.process(
+        version_file,
+        github_dump,
+        record,
+        paths,
+        fixers,
+        abort,
+        local_build=local_build,
+        tree_hash=tree_hash,
+        stable=stable,
+        outdir=outdir,
+        ceiling=ceiling,
+        use_daemon=use_daemon,
+    )
+    if handoff and entries is not None:
+        write_handoff(handoff, {**entries, key: data})
+    return data
+
+
+def _backend() -> Any:
+    from setuptools import build_meta  # type: ignore[import-untyped]
+
+    return build_meta
+
+
+def _deferred(name: str) -> Callable[..., Any]:
+    "a get_requires_for_build_* hook, starting a build"
+
+    def hook(config_settings: dict[str, Any] | None = None) -> Any:
+        # (a new build: the version is computed again by the next hooks)
+        if handoff := handoff_path(Path.cwd()):
+            write_handoff(handoff, {})
+        os.environ[DEFER_ENV] = "1"
+        try:
+            return getattr(_backend(), name)(config_settings)
+        finally:
+            os.environ.pop(DEFER_ENV, None)
+
+    hook.__name__ = name
+    return hook
+
+
+def _final(name: str) -> Callable[..., Any]:
+    "a build_* hook, ending the build"
+
+    def hook(*args: Any, **kwargs: Any) -> Any:
+        try:
+            return getattr(_backend(), name)(*args, **kwargs)
+        finally:
+            if (handoff := handoff_path(Path.cwd())) and handoff.exists():
+                handoff.unlink()
+
+    hook.__name__ = name
+    return hook
+
+
+get_requires_for_build_wheel = _deferred("get_requires_for_build_wheel")
+get_requires_for_build_sdist = _deferred("get_requires_for_build_sdist")
+get_requires_for_build_editable = _deferred("get_requires_for_build_editable")
+build_wheel = _final("build_wheel")
+build_sdist = _final("build_sdist")
+build_editable = _final("build_editable")
+
+
+def __getattr__(name: str) -> Any:
+    # (setuptools.build_meta is imported on the first hook call)
+    if name in HOOKS:
+        return getattr(_backend(), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,143 @@
+"""the commits between consecutive release tags
+
+    setuptools-github changelog
+
+The log is read streaming (git log -z) and the commits between two
+release tags (immutable) are cached in the git directory, so only the
+commits since the last release are walked on each run.
+
+    for title, commits in changelog.sections(repo):
+        print(title, [c.subject for c in commits])
+"""
+from __future__ import annotations
+
+import dataclasses as dc
+import json
+import os
+import re
+from pathlib import Path
+from typing import Iterator
+
+from . import scm
+
+# the commit fields, unit separated (the records are NUL separated)
+FORMAT = "%H%x1f%aN%x1f%aI%x1f%s"
+CACHE_NAME = "setuptools-github-changelog.json"
+
+
+@dc.dataclass
+class Commit:
+    sha: str
+    author: str
+    date: str
+    subject: str
+
+    def __str__(self) -> str:
+        return self.subject
+
+
+def iter_log(repo: scm.GitRepo, end: str, start: str | None = None) -> Iterator[Commit]:
+    "yields the commits reachable from end and not from start (newest first)"
+    revs = [f"{start}..{end}"] if start else [end]
+    for record in repo.stream(["log", "-z", f"--format={FORMAT}", *revs]):
+        # (a record may start with the newline ending the previous one)
+        if txt := os.fsdecode(record).strip("\n"):
+            yield Commit(*txt.split("\x1f", 3))
+
+
+def releases(repo: scm.GitRepo, prefix: str = "release/") -> list[str]:
+    "the release tags (oldest first, by version)"
+    return [
+        os.fsdecode(line)
+        for line in repo.stream(
+            [
+                "for-each-ref",
+                "--sort=version:refname",
+                "--format=%(refname:short)",
+                f"refs/tags/{prefix}",
+            ],
+            b"\n",
+        )
+        if line
+    ]
+
+
+class Cache:
+    "the commits between two (tagged) commits, keyed on their shas"
+
+    def __init__(self, path: Path):
+        self.path = path
+        try:
+            self.data = json.loads(path.read_text())
+        except (OSError, ValueError):
+            self.data = {}
+        self.changed = False
+
+    def get(self, key: str) -> list[Commit] | None:
+        if key not in self.data:
+            return None
+        return [Commit(*fields) for fields in self.data[key]]
+
+    def set(self, key: str, commits: list[Commit]) -> None:
+        self.data[key] = [dc.astuple(commit) for commit in commits]
+        self.changed = True
+
+    def save(self) -> None:
+        if not self.changed:
+            return
+        tmp = self.path.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(self.data))
+        tmp.replace(self.path)
+        self.changed = False
+
+
+def entries(
+    repo: scm.GitRepo, end: str, start: str | None = None, cache: Cache | None = None
+) -> list[Commit]:
+    "the commits in start..end (cached if given a cache)"
+    if cache is None:
+        return list(iter_log(repo, end, start))
+    names = [end, *([start] if start else [])]
+    shas = repo(["rev-parse", *(f"{n}^{{commit}}" for n in names)]).split()
+    key = "..".join(reversed(shas))
+    if (result := cache.get(key)) is None:
+        result = list(iter_log(repo, shas[0], shas[1] if start else None))
+        cache.set(key, result)
+    return result
+
+
+def sections(
+    repo: scm.GitRepo, prefix: str = "release/", head: bool = True
+) -> list[tuple[str, list[Commit]]]:
+    """the (title, commits) for each release (newest first)
+
+    Args:
+        repo: the git repo
+        prefix: the release tags prefix
+        head: add the commits since the last release if HEAD is a beta branch
+    """
+    cache = Cache(repo.commondir / CACHE_NAME)
+    tags = releases(repo, prefix)
+    result = []
+    for start, end in zip([None, *tags], tags):
+        result.append((end, entries(repo, end, start, cache)))
+    cache.save()
+
+    try:
+        branch = repo.head.shorthand if head else ""
+    except scm.GitError:
+        branch = ""  # detached
+    if re.search(r"(^|/)beta/\d+([.]\d+)*$", branch):
+        commits = entries(repo, "HEAD", tags[-1] if tags else None)
+        result.append((f"{branch} (unreleased)", commits))
+    return result[::-1]
+
+
+def render(items: list[tuple[str, list[Commit]]]) -> str:
+    "a markdown changelog"
+    lines = []
+    for title, commits in items:
+        lines.extend([f"## {title}", ""])
+        lines.extend(f"- {commit.subject} ({commit.sha[:7]})" for commit in commits)
+        lines.append("")
+    return "\n".join(lines)
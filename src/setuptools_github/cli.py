@@ -1,12 +1,11 @@
 from __future__ import annotations
 
-import argparse
 import functools
-import logging
 import sys
-from typing import Any, Callable, Protocol
+from typing import TYPE_CHECKING, Any, Callable, Protocol
 
-from . import tools
+if TYPE_CHECKING:
+    import argparse
 
 
 class ErrorFn(Protocol):
@@ -14,9 +13,23 @@ class ErrorFn(Protocol):
         ...
 
 
+class LazyLogger:
+    "a logging.getLogger(name) proxy, importing logging on first use"
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __getattr__(self, attr: str) -> Any:
+        import logging
+
+        return getattr(logging.getLogger(self.name), attr)
+
+
 class AbortExecutionError(Exception):
     @staticmethod
     def _strip(txt):
+        from . import tools
+
         txt = txt or ""
         txt = txt[1:] if txt.startswith("\n") else txt
         txt = tools.indent(txt, pre="")
@@ -35,6 +48,8 @@ class AbortExecutionError(Exception):
         self.usage = usage
 
     def __str__(self):
+        from . import tools
+
         out = []
         if self.usage:
             out.extend(self.usage.strip().split("\n"))
@@ -65,6 +80,8 @@ def _add_arguments(
 def _process_options(
     options: argparse.Namespace, errorfn: ErrorFn
 ) -> argparse.Namespace | None:
+    import logging
+
     logging.basicConfig(
         format="%(levelname)s:%(name)s:(dry-run) %(message)s"
         if options.dryrun
@@ -89,6 +106,8 @@ def cli(
     def _fn(main: Callable[[argparse.Namespace], Any]):
         @functools.wraps(main)
         def _fn1(args: None | list[str] = None) -> Any:
+            import argparse
+
             try:
 
                 class ParserFormatter(
@@ -0,0 +1,238 @@
+"""a long lived process answering tools.get_data requests over a unix socket
+
+    setuptools-github serve [--socket PATH]
+
+It keeps a warm GitRepo for each repository (the head is cached until
+HEAD, the refs or the index change) so each request avoids the python
+startup, the repo discovery and most of the git calls.
+
+The wire protocol is one json line per connection, the request:
+    {"version_file": "/abs/path/__init__.py", "github_dump": null,
+     "record_path": null, "abort": true, "local_build": false,
+     "tree_hash": false}
+and the reply:
+    {"data": {...}, "gdata": {...}} or {"error": "..."}
+
+The daemon is opt-in: tools.process asks it only when $SETUPTOOLS_GITHUB_SOCKET
+is set (or with use_daemon), falling back to the in-process tools.get_data.
+The client talks only to a socket owned by the current user and checks the
+reply values before they are written in any file.
+"""
+from __future__ import annotations
+
+import json
+import os
+import re
+import socket
+from pathlib import Path
+from typing import Any
+
+from . import scm, tools
+
+SOCKET_ENV = "SETUPTOOLS_GITHUB_SOCKET"
+SOCKET_NAME = "setuptools-github.sock"
+
+# the reply values format
+VERSION_RE = re.compile(r"[0-9A-Za-z][0-9A-Za-z.+!_-]*")
+SHA_RE = re.compile(r"[0-9a-f]{7,64}[*]?")
+
+
+def socket_path() -> Path:
+    """the daemon socket path
+
+    $SETUPTOOLS_GITHUB_SOCKET or a file in a private (0700) per user directory,
+    $XDG_RUNTIME_DIR or a setuptools-github-<uid> directory in the tmp dir
+    """
+    from tempfile import gettempdir
+
+    if value := os.getenv(SOCKET_ENV):
+        return Path(value)
+    if value := os.getenv("XDG_RUNTIME_DIR"):
+        return Path(value) / SOCKET_NAME
+    uid = os.getuid() if hasattr(os, "getuid") else os.getpid()
+    return Path(gettempdir()) / f"setuptools-github-{uid}" / SOCKET_NAME
+
+
+def private_dir(path: Path) -> Path:
+    "creates the (0700) directory path, failing if it's not owned by the user"
+    import stat
+
+    path.mkdir(mode=0o700, parents=True, exist_ok=True)
+    info = path.lstat()
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid():
+        raise tools.ToolsError(f"cannot use {path}, not a directory of the user")
+    if info.st_mode & 0o077:
+        raise tools.ToolsError(f"cannot use {path}, accessible by other users")
+    return path
+
+
+def trusted(path: Path) -> bool:
+    "True if path is a socket owned by the user"
+    import stat
+
+    try:
+        info = path.lstat()
+    except OSError:
+        return False
+    return stat.S_ISSOCK(info.st_mode) and info.st_uid == os.getuid()
+
+
+def valid(data: Any) -> bool:
+    "True if the get_data reply data values have the expected formats"
+    if not isinstance(data, dict) or not isinstance(data.get("version"), str):
+        return False
+    if not VERSION_RE.fullmatch(data["version"]):
+        return False
+    if data.get("sha") is not None and not (
+        isinstance(data["sha"], str) and SHA_RE.fullmatch(data["sha"])
+    ):
+        return False
+    return all(
+        value is None
+        or isinstance(value, int)
+        or (isinstance(value, str) and value.isprintable())
+        for value in data.values()
+    )
+
+
+class WarmRepo(scm.GitRepo):
+    "a GitRepo caching head until HEAD, the current ref or the index change"
+
+    def __init__(self, workdir: Path | str, exe: str = "git", gitdir: Path | str = ""):
+        super().__init__(workdir, exe, gitdir)
+        self._head: scm.GitRepoHead | None = None
+        self._key: tuple[Any, ...] = ()
+        # (the real git directories, .git is a file in linked worktrees)
+        self.disk = scm.DiskBackend(self)
+
+    def signature(self) -> tuple[Any, ...]:
+        result: list[tuple[int, int] | None] = []
+        head = self.disk.gitdir / "HEAD"
+        txt = head.read_text().strip() if head.exists() else ""
+        for path in self.disk.head_files():
+            try:
+                stat = path.stat()
+                result.append((stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                result.append(None)
+        return (txt, *result)
+
+    @property
+    def head(self):
+        key = self.signature()
+        if self._head is None or key != self._key:
+            self._head = super().head
+            self._key = key
+        return self._head
+
+
+class Handler:
+    "answers the requests (keeping the warm repos)"
+
+    def __init__(self) -> None:
+        self.cache: dict[Path, scm.GitRepo | None] = {}
+        self.repos: dict[Path, WarmRepo] = {}
+
+    def __call__(self, request: dict[str, Any]) -> dict[str, Any]:
+        version_file = Path(request["version_file"])
+        record_path = request.get("record_path")
+        repo = scm.lookup(version_file.parent, self.cache)
+        if repo and repo.workdir not in self.repos:
+            self.repos[repo.workdir] = WarmRepo(repo.workdir)
+        data, gdata = tools.get_data(
+            version_file,
+            request.get("github_dump"),
+            Path(record_path) if record_path else None,
+            request.get("abort", True),
+            self.repos[repo.workdir] if repo else None,
+            request.get("local_build", False),
+            request.get("tree_hash", False),
+        )
+        return {"data": data, "gdata": gdata}
+
+
+def make_server(path: Path | None = None):
+    "returns a (threading) unix socket server listening on path"
+    import socketserver
+
+    handler = Handler()
+
+    class RequestHandler(socketserver.StreamRequestHandler):
+        def handle(self):
+            try:
+                reply = handler(json.loads(self.rfile.readline()))
+            except Exception as exc:
+                reply = {"error": f"{exc.__class__.__name__}: {exc}"}
+            self.wfile.write(json.dumps(reply, default=str).encode("utf-8") + b"\n")
+
+    class Server(socketserver.ThreadingUnixStreamServer):
+        daemon_threads = True
+
+        def server_close(self):
+            super().server_close()
+            Path(self.server_address).unlink(missing_ok=True)
+
+    if not path:
+        path = socket_path()
+        if not os.getenv(SOCKET_ENV):
+            private_dir(path.parent)
+    path.unlink(missing_ok=True)
+    return Server(str(path), RequestHandler)
+
+
+def serve(path: Path | None = None) -> None:
+    server = make_server(path)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def query(
+    version_file: str | Path,
+    github_dump: str | None = None,
+    record_path: Path | None = None,
+    abort: bool = True,
+    path: Path | None = None,
+    timeout: float = 5.0,
+    local_build: bool = False,
+    tree_hash: bool = False,
+) -> tuple[dict[str, str | None], dict[str, Any]] | None:
+    """asks the daemon for the tools.get_data result
+
+    Args:
+        path: the daemon socket (default to $SETUPTOOLS_GITHUB_SOCKET, when
+              unset the daemon isn't asked)
+
+    Returns:
+        None if the daemon is not available (or fails, or its reply isn't
+        valid), so the caller can fall back to tools.get_data
+    """
+    if not path and os.getenv(SOCKET_ENV):
+        path = socket_path()
+    if not (path and hasattr(socket, "AF_UNIX") and trusted(path)):
+        return None
+    request = {
+        "version_file": str(Path(version_file).absolute()),
+        "github_dump": github_dump,
+        "record_path": str(record_path) if record_path else None,
+        "abort": abort,
+        "local_build": local_build,
+        "tree_hash": tree_hash,
+    }
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect(str(path))
+            sock.sendall(json.dumps(request).encode("utf-8") + b"\n")
+            with sock.makefile("rb") as fp:
+                reply = json.loads(fp.readline())
+    except (OSError, ValueError):
+        return None
+    if not isinstance(reply, dict) or "error" in reply:
+        return None
+    if not valid(reply.get("data")):
+        return None
+    return reply["data"], reply.get("gdata") or {}
@@ -0,0 +1,194 @@
+"""git hooks keeping a build context file up to date
+
+    setuptools-github install-hooks src/package_name/__init__.py
+
+installs the post-checkout, post-commit, post-merge and post-rewrite hooks:
+each writes the context file (ref, sha, dirty flag and version) next to the
+version files, so tools.get_data reads it with a single open instead of
+resolving HEAD with git. The context is fresh while HEAD, the index, the
+current branch ref and packed-refs are unchanged (so a git reset --soft or
+update-ref, moving the branch without the hooks, makes it stale).
+
+Editing files touches none of them: the context keeps the tracked files
+signatures (mtime and size) taken with the dirty flag, and tools.get_data
+runs a git diff only if one changed (see context_dirty). The hooks run this
+module (python -m setuptools_github.hooks), reading HEAD from disk.
+
+During a rebase (or an interactive one) the hooks do nothing: post-rewrite
+updates the context once at the end. The context file is added to the
+.git/info/exclude file.
+"""
+from __future__ import annotations
+
+import json
+import os
+from pathlib import Path
+from typing import Any
+
+from . import scm, tools
+
+CONTEXT_NAME = ".setuptools-github-context.json"
+HOOKS = ["post-checkout", "post-commit", "post-merge", "post-rewrite"]
+MARKER = "# installed by setuptools-github install-hooks"
+
+TEMPLATE = """\
+#!/bin/sh
+{marker}
+{skip}
+GIT_OPTIONAL_LOCKS=0 PYTHONPATH="{pythonpath}${{PYTHONPATH:+:$PYTHONPATH}}" \\
+    "{python}" -m setuptools_github.hooks {version_files} >/dev/null 2>&1 || true
+"""
+
+# (rebase runs post-checkout/post-commit for each picked commit)
+SKIP = """\
+for name in rebase-merge rebase-apply; do
+    [ -d "$(git rev-parse --git-path $name)" ] && exit 0
+done"""
+
+
+def context_path(version_file: str | Path) -> Path:
+    return Path(version_file).absolute().parent / CONTEXT_NAME
+
+
+def signature(path: Path) -> list[int] | None:
+    try:
+        stat = path.stat()
+    except OSError:
+        return None
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def tracked(repo: scm.GitRepo) -> dict[str, list[int] | None]:
+    "the tracked files signatures (the submodules have none, always checked)"
+    result = {}
+    for record in repo.stream(["ls-files", "-z", "-s", "--full-name"]):
+        meta, _, name = os.fsdecode(record).partition("\t")
+        if name:
+            gitlink = meta.startswith("160000")
+            result[name] = None if gitlink else signature(repo.workdir / name)
+    return result
+
+
+def write_context(repo: scm.GitRepo, version_file: str | Path) -> dict[str, Any]:
+    "writes the context file for version_file (returns its content)"
+    head = repo.head
+    gdata = {"ref": head.name, "sha": head.target.hex, "run_number": 0, "run_id": 0}
+    # (as a github dump: no git status)
+    data = tools.get_data(version_file, json.dumps(gdata))[0]
+
+    # (the files before the diff: a file changed in between fails its signature)
+    files = tracked(repo)
+    context = {
+        "workdir": str(repo.workdir),
+        "signature": [
+            [str(path), signature(path)] for path in scm.DiskBackend(repo).head_files()
+        ],
+        "ref": data["ref"],
+        "sha": data["sha"],
+        "version": data["version"],
+        "dirty": dirty(repo),
+        "files": files,
+    }
+
+    path = context_path(version_file)
+    tmp = path.with_suffix(f".{os.getpid()}.tmp")
+    tmp.write_text(json.dumps(context))
+    tmp.replace(path)
+    return context
+
+
+def read_context(version_file: str | Path) -> dict[str, Any] | None:
+    "the context for version_file (None if missing or stale)"
+    try:
+        with context_path(version_file).open() as fp:
+            context = json.load(fp)
+        fresh = all(signature(Path(path)) == sig for path, sig in context["signature"])
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+    return context if fresh else None
+
+
+def context_dirty(context: dict[str, Any]) -> bool:
+    "the context dirty flag, checked with a git diff if a tracked file changed"
+    workdir = Path(context["workdir"])
+    if all(signature(workdir / name) == sig for name, sig in context["files"].items()):
+        return bool(context["dirty"])
+    return dirty(scm.GitRepo(workdir))
+
+
+def dirty(repo: scm.GitRepo) -> bool:
+    "True if the tracked files have local changes (the index isn't written)"
+    import subprocess
+
+    try:
+        repo(["diff", "--quiet", "HEAD", "--"], env={"GIT_OPTIONAL_LOCKS": "0"})
+    except subprocess.CalledProcessError as exc:
+        if exc.returncode == 1:
+            return True
+        raise
+    return False
+
+
+def install(
+    repo: scm.GitRepo, version_files: list[Path], force: bool = False
+) -> list[Path]:
+    """installs the hooks (and writes the context files)
+
+    Args:
+        repo: the git repo
+        version_files: the version files to keep the context for
+        force: overwrite hooks not installed by setuptools-github
+
+    Returns:
+        list[Path]: the hooks installed
+    """
+    import sys
+    from shlex import quote
+
+    hooksdir = Path(repo(["rev-parse", "--git-path", "hooks"]).strip())
+    if not hooksdir.is_absolute():
+        hooksdir = repo.workdir / hooksdir
+    hooksdir.mkdir(parents=True, exist_ok=True)
+
+    files = [Path(f).absolute() for f in version_files]
+    result = []
+    for name in HOOKS:
+        path = hooksdir / name
+        if path.exists() and MARKER not in path.read_text() and not force:
+            raise tools.ToolsError(f"hook {path} present (not ours)", path)
+        path.write_text(
+            TEMPLATE.format(
+                marker=MARKER,
+                skip="" if name == "post-rewrite" else SKIP,
+                pythonpath=Path(__file__).absolute().parent.parent,
+                python=sys.executable,
+                version_files=" ".join(quote(str(f)) for f in files),
+            )
+        )
+        path.chmod(0o755)
+        result.append(path)
+
+    exclude = repo.commondir / "info" / "exclude"
+    exclude.parent.mkdir(parents=True, exist_ok=True)
+    lines = exclude.read_text().split("\n") if exclude.exists() else []
+    if CONTEXT_NAME not in lines:
+        txt = "\n".join(lines).rstrip("\n")
+        exclude.write_text((txt + "\n" if txt else "") + CONTEXT_NAME + "\n")
+
+    for version_file in files:
+        write_context(repo, version_file)
+    return result
+
+
+def main(argv: list[str] | None = None) -> None:
+    "the hooks entry point: writes the context for the version files in argv"
+    import sys
+
+    cache: dict[Path, scm.GitRepo | None] = {}
+    for arg in sys.argv[1:] if argv is None else argv:
+        if repo := scm.lookup(Path(arg).absolute().parent, cache):
+            write_context(repo, arg)
+
+
+if __name__ == "__main__":
+    main()
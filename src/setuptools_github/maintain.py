@@ -0,0 +1,79 @@
+"""keeps the git queries issued by setuptools-github fast
+
+    setuptools-github maintain [--midx]
+
+On long lived runners the repos accumulate loose refs and commits
+without a commit-graph: this writes (or refreshes) the commit-graph,
+packs the refs, enables the untracked cache and optionally writes a
+multi-pack-index, timing the tool queries before and after.
+"""
+from __future__ import annotations
+
+from pathlib import Path
+
+from . import scm
+
+# the queries issued by tools.get_data and script.main (cli backend)
+QUERIES: dict[str, list[str | Path]] = {
+    "symbolic-ref": ["symbolic-ref", "HEAD"],
+    "rev-parse": ["rev-parse", "HEAD"],
+    "status": ["status", "--porcelain", "--untracked-files=all"],
+    "branch": ["branch", "-a", "--format", "%(refname)"],
+    "tag": ["tag", "-l"],
+}
+
+
+def timings(repo: scm.GitRepo, repeat: int = 3) -> dict[str, float]:
+    "the best of repeat timings (in seconds) for each of the QUERIES"
+    from time import perf_counter
+
+    result = {}
+    for name, cmd in QUERIES.items():
+        best = float("inf")
+        for _ in range(repeat):
+            start = perf_counter()
+            repo(cmd)
+            best = min(best, perf_counter() - start)
+        result[name] = best
+    return result
+
+
+def maintain(repo: scm.GitRepo, midx: bool = False) -> list[str]:
+    """runs the maintenance steps on repo
+
+    Returns:
+        list[str]: the git commands run
+    """
+    steps: list[list[str | Path]] = [
+        ["commit-graph", "write", "--reachable"],
+        ["pack-refs", "--all"],
+        ["update-index", "--untracked-cache"],
+    ]
+    # (git refuses to write a multi-pack-index without packs)
+    if midx and any((repo.commondir / "objects" / "pack").glob("*.pack")):
+        steps.append(["multi-pack-index", "write"])
+
+    repo.config.update({"core.untrackedCache": "true"})
+    for step in steps:
+        repo(step)
+    return [" ".join(str(arg) for arg in step) for step in steps]
+
+
+def report(
+    steps: list[str], before: dict[str, float], after: dict[str, float]
+) -> str:
+    width = max(len(name) for name in [*before, "query"])
+    lines = [f"{'query':{width}}  before(ms)  after(ms)"]
+    for name in before:
+        lines.append(
+            f"{name:{width}}  {before[name] * 1000:10.1f}  {after[name] * 1000:9.1f}"
+        )
+    return "\n".join(
+        [
+            "Maintenance steps:",
+            scm.indent("\n".join(steps), pre=" " * 4),
+            "",
+            "Timings (best run):",
+            scm.indent("\n".join(lines), pre=" " * 4),
+        ]
+    )
@@ -0,0 +1,272 @@
+"""release engines
+
+They all release the beta/N.M.O branch in the same way:
+  - an empty "released N.M.O" commit on beta/N.M.O
+  - a release/N.M.O annotated tag on it
+  - beta/N.M.O merged into the master branch
+  - a "version bump" commit on master with the new version in the version file
+
+checkout
+  runs the git porcelain commands in the working directory (it leaves
+  the master branch checked out)
+
+plumbing
+  builds the same objects with the git plumbing commands and updates
+  all the refs in a single transaction: the working dir is never touched
+  (and the current branch stays beta/N.M.O)
+
+worktree
+  runs the porcelain commands in a temporary (sparse) linked worktree of
+  master, containing only the version file directory: the current branch
+  stays beta/N.M.O and the working dir is never touched
+
+For monorepos (many version files in one repo) make_betas/release_packages
+handle all the packages at once from the master branch: make_betas creates
+the <name>/beta/N.M.O branches, release_packages releases them (as plumbing
+does) with the <name>/release/N.M.O tags.
+"""
+from __future__ import annotations
+
+import dataclasses as dc
+from pathlib import Path
+from typing import Callable
+
+from . import scm, tools
+
+
+@dc.dataclass
+class Release:
+    version: str
+    new_version: str
+    master: str
+    # (ref, new, old) updated refs
+    updates: list[tuple[str, str, str | None]] = dc.field(default_factory=list)
+
+
+@dc.dataclass
+class Package:
+    name: str
+    initfile: Path
+    version: str
+    new_version: str = ""
+
+    @property
+    def beta(self) -> str:
+        return f"{self.name}/beta/{self.version}"
+
+    @property
+    def tag(self) -> str:
+        return f"{self.name}/release/{self.version}"
+
+
+def checkout(
+    repo: scm.GitRepo, initfile: Path, version: str, new_version: str, master: str
+) -> Release:
+    result = Release(version, new_version, master)
+
+    # create an empty commit to mark the release
+    repo(["commit", "--allow-empty", "-m", f"released {version}"])
+
+    # tag
+    repo(["tag", "-a", f"release/{version}", "-m", f"released {version}"])
+
+    # switch to master (and incorporate the commit message)
+    repo(["checkout", master])
+    repo(["merge", f"beta/{version}"])
+
+    # bump version
+    tools.set_module_var(initfile, "__version__", new_version)
+
+    # commit
+    repo.commit(initfile, f"version bump {version} -> {new_version}")
+    return result
+
+
+def plumbing(
+    repo: scm.GitRepo, initfile: Path, version: str, new_version: str, master: str
+) -> Release:
+    from tempfile import TemporaryDirectory
+
+    result = Release(version, new_version, master)
+
+    beta_ref = f"refs/heads/beta/{version}"
+    master_ref = f"refs/heads/{master}"
+    beta = repo.rev_parse(beta_ref)
+    head = repo.rev_parse(master_ref)
+
+    # the empty commit and the tag
+    released = repo.commit_tree(f"{beta}^{{tree}}", [beta], f"released {version}")
+    tag = repo.mktag(f"release/{version}", released, f"released {version}")
+
+    # the merge into master
+    if repo.is_ancestor(head, released):
+        merged = released
+    else:
+        merged = repo.commit_tree(
+            repo.merge_tree(head, released),
+            [head, released],
+            f"Merge branch 'beta/{version}'",
+        )
+
+    # the version bump
+    path = initfile.absolute().relative_to(repo.workdir).as_posix()
+    with TemporaryDirectory() as tmpdir:
+        newfile = Path(tmpdir) / initfile.name
+        newfile.write_text(repo(["cat-file", "blob", f"{merged}:{path}"]))
+        tools.set_module_var(newfile, "__version__", new_version)
+        tree = repo.write_tree(merged, {path: newfile})
+    bumped = repo.commit_tree(
+        tree, [merged], f"version bump {version} -> {new_version}"
+    )
+
+    result.updates = [
+        (beta_ref, released, beta),
+        (f"refs/tags/release/{version}", tag, None),
+        (master_ref, bumped, head),
+    ]
+    repo.update_refs(result.updates, f"setuptools-github: release {version}")
+    return result
+
+
+def worktree(
+    repo: scm.GitRepo, initfile: Path, version: str, new_version: str, master: str
+) -> Release:
+    from tempfile import TemporaryDirectory
+
+    result = Release(version, new_version, master)
+
+    beta_ref = f"refs/heads/beta/{version}"
+    master_ref = f"refs/heads/{master}"
+    beta = repo.rev_parse(beta_ref)
+    head = repo.rev_parse(master_ref)
+
+    # the empty commit and the tag (no files are touched)
+    repo(["commit", "--allow-empty", "-m", f"released {version}"])
+    repo(["tag", "-a", f"release/{version}", "-m", f"released {version}"])
+
+    path = initfile.absolute().relative_to(repo.workdir)
+    sparse = ["-c", "core.sparseCheckout=true"]
+    with TemporaryDirectory() as tmpdir:
+        workdir = Path(tmpdir) / "release"
+        repo(["worktree", "add", "--no-checkout", workdir, master])
+        try:
+            gitdir = (workdir / ".git").read_text().partition("gitdir:")[2].strip()
+            wt = scm.GitRepo(workdir, gitdir=gitdir)
+
+            # only the version file directory is checked out
+            (wt.gitdir / "info").mkdir(parents=True, exist_ok=True)
+            (wt.gitdir / "info" / "sparse-checkout").write_text(
+                f"/{path.parent.as_posix()}/\n" if path.parent.parts else f"/{path}\n"
+            )
+            wt([*sparse, "read-tree", "-mu", "HEAD"])
+
+            # incorporate the beta branch and bump version
+            wt([*sparse, "merge", "--no-edit", f"beta/{version}"])
+            tools.set_module_var(workdir / path, "__version__", new_version)
+            wt(
+                [
+                    *sparse,
+                    "commit",
+                    "-m",
+                    f"version bump {version} -> {new_version}",
+                    "--",
+                    path,
+                ]
+            )
+        finally:
+            repo(["worktree", "remove", "--force", workdir])
+
+    result.updates = [
+        (beta_ref, repo.rev_parse(beta_ref), beta),
+        (f"refs/tags/release/{version}", repo.rev_parse(f"release/{version}"), None),
+        (master_ref, repo.rev_parse(master_ref), head),
+    ]
+    return result
+
+
+ENGINES: dict[str, Callable[[scm.GitRepo, Path, str, str, str], Release]] = {
+    "checkout": checkout,
+    "plumbing": plumbing,
+    "worktree": worktree,
+}
+
+
+def make_betas(
+    repo: scm.GitRepo, packages: list[Package], master: str
+) -> list[tuple[str, str, str | None]]:
+    "creates the <name>/beta/N.M.O branches from master (in one transaction)"
+    head = repo.rev_parse(f"refs/heads/{master}")
+    updates: list[tuple[str, str, str | None]] = [
+        (f"refs/heads/{package.beta}", head, None) for package in packages
+    ]
+    repo.update_refs(updates, "setuptools-github: make-beta")
+    return updates
+
+
+def release_packages(
+    repo: scm.GitRepo, packages: list[Package], master: str, jobs: int | None = None
+) -> list[tuple[str, str, str | None]]:
+    """releases the <name>/beta/N.M.O branches into master (as plumbing does)
+
+    Each beta branch gets a "released N.M.O" commit tagged <name>/release/N.M.O
+    and is merged into master, then a single commit bumps all the versions
+    (written in parallel): all the refs are updated in one transaction and
+    the working dir (on the master branch) follows the new master head.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from tempfile import TemporaryDirectory
+
+    master_ref = f"refs/heads/{master}"
+    head = merged = repo.rev_parse(master_ref)
+
+    updates: list[tuple[str, str, str | None]] = []
+    for package in packages:
+        beta_ref = f"refs/heads/{package.beta}"
+        beta = repo.rev_parse(beta_ref)
+        message = f"released {package.version}"
+        released = repo.commit_tree(f"{beta}^{{tree}}", [beta], message)
+        updates.append((beta_ref, released, beta))
+        updates.append(
+            (
+                f"refs/tags/{package.tag}",
+                repo.mktag(package.tag, released, message),
+                None,
+            )
+        )
+        if repo.is_ancestor(merged, released):
+            merged = released
+        else:
+            merged = repo.commit_tree(
+                repo.merge_tree(merged, released),
+                [merged, released],
+                f"Merge branch '{package.beta}'",
+            )
+
+    with TemporaryDirectory() as tmpdir:
+
+        def bump(package: Package) -> tuple[str, Path]:
+            path = package.initfile.absolute().relative_to(repo.workdir).as_posix()
+            newfile = Path(tmpdir) / package.name / package.initfile.name
+            newfile.parent.mkdir()
+            newfile.write_text(repo(["cat-file", "blob", f"{merged}:{path}"]))
+            tools.set_module_var(newfile, "__version__", package.new_version)
+            return path, newfile
+
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            files = dict(pool.map(bump, packages))
+        tree = repo.write_tree(merged, files)
+
+    message = "\n".join(
+        [
+            "version bump",
+            "",
+            *(f"{p.name}: {p.version} -> {p.new_version}" for p in packages),
+        ]
+    )
+    bumped = repo.commit_tree(tree, [merged], message)
+    updates.append((master_ref, bumped, head))
+    repo.update_refs(updates, "setuptools-github: release")
+
+    # the index and the working dir follow the new master head
+    repo(["read-tree", "-m", "-u", head, bumped])
+    return updates
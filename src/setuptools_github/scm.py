@@ -1,15 +1,20 @@
 from __future__ import annotations
 
 import dataclasses as dc
-import io
+import os
 import re
 import subprocess
+from abc import ABC, abstractmethod
 from pathlib import Path
-from typing import Any, List, Union
+from typing import TYPE_CHECKING
 
-from typing_extensions import TypeAlias
+if TYPE_CHECKING:
+    import threading
+    from typing import IO, Any, Callable, Iterable, Iterator, List, Union
 
-ListOfArgs: TypeAlias = Union[str, Path, List[Union[str, Path]]]
+    from typing_extensions import TypeAlias
+
+    ListOfArgs: TypeAlias = Union[str, Path, List[Union[str, Path]]]
 
 
 def to_list_of_paths(paths: ListOfArgs) -> list[Path]:
@@ -49,12 +54,123 @@ class InvalidGitRepoError(GitError):
     pass
 
 
+class GitTimeoutError(GitError):
+    pass
+
+
+class GitCancelledError(GitError):
+    pass
+
+
+# "fetch=60,clone=600" (seconds, a bare number is for all the LONG_VERBS)
+TIMEOUTS_ENV = "SETUPTOOLS_GITHUB_TIMEOUTS"
+# the commands talking to the remotes (or slow), supporting --progress
+LONG_VERBS = ("fetch", "clone", "merge")
+
+
+def parse_timeouts(txt: str | list[str]) -> dict[str, float]:
+    "parses the 'verb=seconds' (comma separated) timeouts"
+    result: dict[str, float] = {}
+    for item in txt.split(",") if isinstance(txt, str) else txt:
+        verb, _, value = item.strip().rpartition("=")
+        if not value:
+            continue
+        for name in [verb] if verb else LONG_VERBS:
+            result[name] = float(value)
+    return result
+
+
+def git_verb(cmd: ListOfArgs) -> str | None:
+    "the git command in cmd (eg. fetch), skipping the leading -c options"
+    skip = False
+    for arg in [str(c) for c in (cmd if isinstance(cmd, list) else [cmd])]:
+        if skip or arg in {"-c", "-C"}:
+            skip = not skip
+        elif not arg.startswith("-"):
+            return arg
+    return None
+
+
+def killpg(proc: subprocess.Popen, grace: float = 2.0) -> None:
+    "terminates proc process group (SIGKILL after grace seconds)"
+    import signal
+
+    if not hasattr(os, "killpg"):
+        proc.kill()
+        proc.wait()
+        return
+    for sig in [signal.SIGTERM, signal.SIGKILL]:
+        try:
+            os.killpg(proc.pid, sig)
+        except ProcessLookupError:
+            break
+        try:
+            proc.wait(grace)
+            break
+        except subprocess.TimeoutExpired:
+            continue
+
+
 @dc.dataclass
 class GitRepoBranches:
     local: list[str]
     remote: list[str]
 
 
+@dc.dataclass(frozen=True)
+class GitBranch:
+    ref: str  # eg. refs/heads/beta/0.0.0 or refs/remotes/origin/beta/0.0.0
+    sha: str
+
+    @property
+    def remote(self) -> bool:
+        return self.ref.startswith("refs/remotes/")
+
+    @property
+    def name(self) -> str:
+        "the branch name (eg. beta/0.0.0 or origin/beta/0.0.0)"
+        return self.ref[13:] if self.remote else shorthand(self.ref)
+
+
+class GitBranchIndex:
+    """a compact (sorted) index of branch refs to their sha
+
+    Supports exact and prefix lookups by bisection, eg.:
+        index.prefix("refs/remotes/origin/beta/")
+    """
+
+    def __init__(self, branches: Iterable[GitBranch]):
+        pairs = sorted((b.ref, b.sha) for b in branches)
+        self.refs = tuple(ref for ref, _ in pairs)
+        self.shas = tuple(sha for _, sha in pairs)
+
+    def __len__(self) -> int:
+        return len(self.refs)
+
+    def __contains__(self, ref: str) -> bool:
+        from bisect import bisect_left
+
+        index = bisect_left(self.refs, ref)
+        return index < len(self.refs) and self.refs[index] == ref
+
+    def __getitem__(self, ref: str) -> str:
+        from bisect import bisect_left
+
+        index = bisect_left(self.refs, ref)
+        if index < len(self.refs) and self.refs[index] == ref:
+            return self.shas[index]
+        raise KeyError(ref)
+
+    def prefix(self, prefix: str) -> Iterator[GitBranch]:
+        "yields the branches whose ref starts with prefix (in sorted order)"
+        from bisect import bisect_left
+
+        index = bisect_left(self.refs, prefix)
+        while index < len(self.refs) and self.refs[index].startswith(prefix):
+            yield GitBranch(self.refs[index], self.shas[index])
+            index += 1
+
+
 @dc.dataclass
 class GitRepoHead:
     @dc.dataclass
@@ -69,13 +185,167 @@ class GitRepoHead:
         return shorthand(self.name)
 
 
+def records(fp: IO[bytes], sep: bytes, size: int = 2**16) -> Iterator[bytes]:
+    "yields the sep separated records read from fp (in size chunks)"
+    buf = bytearray()
+    while chunk := fp.read1(size) if hasattr(fp, "read1") else fp.read(size):
+        *found, rest = chunk.split(sep)
+        if found:
+            found[0] = bytes(buf + found[0])
+            yield from found
+            buf.clear()
+        buf += rest
+    if buf:
+        yield bytes(buf)
+
+
 class GitRepoBase:
     def __init__(self, workdir: Path | str, exe: str = "git", gitdir: Path | str = ""):
         self.workdir = Path(workdir).absolute()
         self.exe = exe
         self.gitdir = Path(gitdir or (self.workdir / ".git")).absolute()
+        # per verb timeouts, the cancel event and the progress callback (see run)
+        self.timeouts = parse_timeouts(os.getenv(TIMEOUTS_ENV, ""))
+        self.cancel: threading.Event | None = None
+        self.progress: Callable[[str], Any] | None = None
+
+    def __call__(
+        self,
+        cmd: ListOfArgs,
+        input: str | None = None,  # noqa: A002
+        env: dict[str, str] | None = None,
+    ) -> str:
+        verb = git_verb(cmd)
+        if verb in self.timeouts or (
+            verb in LONG_VERBS and (self.cancel or self.progress)
+        ):
+            return self.run(cmd, input, env)
+        return subprocess.check_output(  # noqa: S603
+            self._arguments(cmd),
+            encoding="utf-8",
+            input=input,
+            env={**os.environ, **env} if env else None,
+        )
 
-    def __call__(self, cmd: ListOfArgs) -> str:
+    def run(
+        self,
+        cmd: ListOfArgs,
+        input: str | None = None,  # noqa: A002
+        env: dict[str, str] | None = None,
+        timeout: float | None = None,
+        cancel: threading.Event | None = None,
+        progress: Callable[[str], Any] | None = None,
+    ) -> str:
+        """runs cmd in its own process group, terminated on timeout or cancel
+
+        Args:
+            cmd: the git command
+            timeout: seconds (default to self.timeouts for the cmd verb)
+            cancel: terminates the command once set (default to self.cancel)
+            progress: called with each --progress line (default to self.progress
+                      for the LONG_VERBS), returning False cancels the command
+
+        Raises:
+            GitTimeoutError, GitCancelledError: the command was terminated
+            subprocess.CalledProcessError: the command failed
+        """
+        import threading
+        from collections import deque
+        from time import monotonic
+
+        cmds = [cmd] if isinstance(cmd, (str, Path)) else list(cmd)
+        verb = git_verb(cmds)
+        timeout = self.timeouts.get(verb or "") if timeout is None else timeout
+        cancel = cancel or self.cancel or threading.Event()
+        if progress is None and verb in LONG_VERBS:
+            progress = self.progress
+        if progress and verb in LONG_VERBS:
+            cmds.insert(cmds.index(verb) + 1, "--progress")
+
+        # (stderr is read on its own pipe, communicate takes stdin/stdout)
+        rfd, wfd = os.pipe() if progress else (None, None)
+        arguments = self._arguments(cmds)
+        proc = subprocess.Popen(  # noqa: S603
+            arguments,
+            stdin=subprocess.PIPE if input is not None else None,
+            stdout=subprocess.PIPE,
+            stderr=wfd,
+            env={**os.environ, **env} if env else None,
+            start_new_session=True,
+        )
+        tail: deque[str] = deque(maxlen=10)
+        threads = []
+        if rfd is not None and wfd is not None and progress:
+            os.close(wfd)
+            callback = progress
+
+            def read_progress() -> None:
+                buf = b""
+                with open(rfd, "rb", buffering=0) as fp:
+                    while chunk := fp.read(2**12):
+                        *lines, buf = (buf + chunk).replace(b"\r", b"\n").split(b"\n")
+                        for line in filter(None, map(os.fsdecode, lines)):
+                            tail.append(line)
+                            if callback(line) is False:
+                                cancel.set()
+
+            threads.append(threading.Thread(target=read_progress, daemon=True))
+
+        output: list[bytes] = []
+        encoded = input.encode("utf-8") if input is not None else None
+        threads.append(
+            threading.Thread(
+                target=lambda: output.append(proc.communicate(encoded)[0]),
+                daemon=True,
+            )
+        )
+        for thread in threads:
+            thread.start()
+
+        deadline = monotonic() + timeout if timeout else None
+        try:
+            while True:
+                threads[-1].join(0.05)
+                if not threads[-1].is_alive():
+                    break
+                if cancel.is_set():
+                    raise GitCancelledError(f"cancelled {' '.join(arguments)}")
+                if deadline and monotonic() > deadline:
+                    raise GitTimeoutError(
+                        f"timeout ({timeout}s) running {' '.join(arguments)}"
+                    )
+        except BaseException:
+            killpg(proc)
+            raise
+        finally:
+            for thread in threads:
+                thread.join()
+
+        if proc.returncode:
+            raise subprocess.CalledProcessError(
+                proc.returncode, arguments, output[0], "\n".join(tail) or None
+            )
+        return output[0].decode("utf-8")
+
+    async def arun(self, cmd: ListOfArgs, **kwargs: Any) -> str:
+        "run (in a thread) from an asyncio task: cancelling the task terminates cmd"
+        import asyncio
+        import threading
+        from functools import partial
+
+        cancel = threading.Event()
+        future = asyncio.get_running_loop().run_in_executor(
+            None, partial(self.run, cmd, cancel=cancel, **kwargs)
+        )
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            cancel.set()
+            await asyncio.wait([future])
+            future.exception()  # (the GitCancelledError)
+            raise
+
+    def _arguments(self, cmd: ListOfArgs) -> list[str]:
         cmds = cmd if isinstance(cmd, list) else [cmd]
 
         arguments = [self.exe]
@@ -89,94 +359,284 @@ class GitRepoBase:
                 ]
             )
         arguments.extend(str(c) for c in cmds)
-        return subprocess.check_output(arguments, encoding="utf-8")  # noqa: S603
+        return arguments
+
+    def git_path(self, name: str) -> Path:
+        "the path of name in the git directory (a linked worktree has its own)"
+        return Path(self(["rev-parse", "--git-path", name]).strip()).absolute()
+
+    def run_bytes(
+        self,
+        cmd: ListOfArgs,
+        input: bytes | None = None,  # noqa: A002
+        env: dict[str, str] | None = None,
+    ) -> bytes:
+        "runs cmd returning its (undecoded) output"
+        return subprocess.check_output(  # noqa: S603
+            self._arguments(cmd),
+            input=input,
+            env={**os.environ, **env} if env else None,
+        )
+
+    def stream(self, cmd: ListOfArgs, sep: bytes = b"\0") -> Iterator[bytes]:
+        """yields the cmd output records (split on sep) as they're produced
+
+        The output is never loaded as a whole: the memory used follows the
+        records size. The records are bytes (os.fsdecode them for the paths).
+        """
+        arguments = self._arguments(cmd)
+        with subprocess.Popen(arguments, stdout=subprocess.PIPE) as proc:  # noqa: S603
+            try:
+                yield from records(proc.stdout, sep) if proc.stdout else []
+            except GeneratorExit:
+                # the caller stopped early
+                proc.kill()
+                raise
+        if proc.returncode:
+            raise subprocess.CalledProcessError(proc.returncode, arguments)
+
+    def _lines(self, cmd: ListOfArgs, sep: str = "\n") -> Iterator[str]:
+        "yields the cmd output records (split on sep) as they're produced"
+        for record in self.stream(cmd, sep.encode()):
+            yield os.fsdecode(record)
 
     def __truediv__(self, other):
         return (self.workdir / other).absolute()
 
     def dumps(self, mask: bool = False) -> str:
-        lines = f"REPO: {self.workdir}"
-        lines += "\n [status]\n" + indent(self(["status"]))
-        branches = self(["branch", "-avv"])
-        if mask:
-            branches = re.sub(r"(..\w\s+)\w{7}(\s+.*)", r"\1ABCDEFG\2", branches)
-        lines += "\n [branch]\n" + indent(branches)
-        lines += "\n [tags]\n" + indent(self(["tag", "-l"]))
-        lines += "\n [remote]\n" + indent(self(["remote", "-v"]))
+        import io
 
         buf = io.StringIO()
-        print("\n".join([line.rstrip() for line in lines.split("\n")]), file=buf)
+        self.dump(buf, mask)
         return buf.getvalue()
 
+    def dump(
+        self,
+        fp: IO[str],
+        mask: bool = False,
+        limit: int | dict[str, int] | None = None,
+    ) -> None:
+        """writes the repo status, branches, tags and remotes into fp
+
+        The four git queries run concurrently, their output is streamed
+        into fp section by section.
+
+        Args:
+            fp: the (text) file-like sink
+            mask: mask the branches shas (for stable outputs)
+            limit: max number of lines per section (or a dict with
+                   a limit for each of "status", "branch", "tags", "remote"),
+                   the remaining lines are only counted
+        """
+        sections: dict[str, tuple[ListOfArgs, str]] = {
+            "status": (["status"], "lines"),
+            "branch": (["branch", "-avv"], "branches"),
+            "tags": (["tag", "-l"], "tags"),
+            "remote": (["remote", "-v"], "remotes"),
+        }
+        procs = {
+            name: subprocess.Popen(  # noqa: S603
+                self._arguments(cmd), stdout=subprocess.PIPE
+            )
+            for name, (cmd, _) in sections.items()
+        }
+        try:
+            fp.write(f"REPO: {self.workdir}\n")
+            for name, proc in procs.items():
+                cmd, noun = sections[name]
+                top = limit.get(name) if isinstance(limit, dict) else limit
+                fp.write(f" [{name}]\n")
+                count = 0
+                for record in records(proc.stdout, b"\n") if proc.stdout else []:
+                    line = os.fsdecode(record)
+                    count += 1
+                    if top is not None and count > top:
+                        continue
+                    if mask and name == "branch":
+                        line = re.sub(r"(..\w\s+)\w{7}(\s+.*)", r"\1ABCDEFG\2", line)
+                    fp.write(f"  {line}".rstrip() + "\n")
+                if top is not None and count > top:
+                    fp.write(f"  ... first {top} of {count:,} {noun}\n")
+                fp.write("\n")
+                if proc.wait():
+                    raise subprocess.CalledProcessError(
+                        proc.returncode, self._arguments(cmd)
+                    )
+        finally:
+            for proc in procs.values():
+                if proc.poll() is None:
+                    proc.kill()
+                proc.wait()
+                if proc.stdout:
+                    proc.stdout.close()
+
+
+def config_key(key: str) -> str:
+    "normalizes a config key (section and name are case insensitive)"
+    section, _, rest = key.partition(".")
+    subsection, dot, name = rest.rpartition(".")
+    return f"{section.lower()}.{subsection}{dot}{name.lower()}"
+
+
+@dc.dataclass
+class GitConfigEntry:
+    key: str
+    value: str | None  # None for a valueless (implicit true) key
+    scope: str  # system, global, local, worktree, command
+    origin: str  # eg. file:/path/to/.git/config (include files show up here)
+
+
+class GitRepoConfig:
+    """the repo config, loaded with a single git config --list
+
+    The entries are cached until one of the config files changes (or
+    the GIT_CONFIG* env variables do): keys are normalized as git does
+    (section and name are case insensitive) and multi valued keys keep
+    all their values (in the git order, the last one wins).
+    """
+
+    def __init__(self, repo: GitRepo):
+        self.repo = repo
+        self._entries: dict[str, list[GitConfigEntry]] | None = None
+        self._signature: tuple[Any, ...] = ()
+
+    def files(self) -> list[Path]:
+        "the config files affecting the repo (existing or not)"
+        home = Path(os.path.expanduser("~"))
+        xdg = Path(os.getenv("XDG_CONFIG_HOME") or (home / ".config"))
+        result = []
+        if not os.getenv("GIT_CONFIG_NOSYSTEM"):
+            # (the usual prefix, the others show up in the entries origins)
+            result.append(Path(os.getenv("GIT_CONFIG_SYSTEM") or "/etc/gitconfig"))
+        result += [
+            self.repo.gitdir / "config",
+            self.repo.gitdir / "config.worktree",
+            Path(os.getenv("GIT_CONFIG_GLOBAL") or (home / ".gitconfig")),
+            xdg / "git" / "config",
+        ]
+        for entries in (self._entries or {}).values():
+            for entry in entries:
+                if entry.origin.startswith("file:"):
+                    result.append(self.repo.workdir / entry.origin[5:])
+        return list(dict.fromkeys(result))
+
+    def signature(self) -> tuple[Any, ...]:
+        result: list[Any] = sorted(
+            (k, v) for k, v in os.environ.items() if k.startswith("GIT_CONFIG")
+        )
+        for path in self.files():
+            try:
+                stat = path.stat()
+                result.append((stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                result.append(None)
+        return tuple(result)
+
+    def invalidate(self) -> None:
+        self._entries = None
 
-class GitRepo(GitRepoBase):
     @property
-    def config(self):
-        @dc.dataclass
-        class X:
-            repo: GitRepo
+    def entries(self) -> dict[str, list[GitConfigEntry]]:
+        "all the (normalized) keys with their entries"
+        if self._entries is not None and self.signature() == self._signature:
+            return self._entries
+        try:
+            txt = self.repo(["config", "--list", "-z", "--show-scope", "--show-origin"])
+        except subprocess.CalledProcessError as exc:
+            raise GitError(f"cannot read the config for {self.repo.workdir}") from exc
 
-            def __getitem__(self, item: str):
-                return self.repo(["config", item]).strip()
+        entries: dict[str, list[GitConfigEntry]] = {}
+        items = txt.split("\0")
+        for scope, origin, item in zip(items[0::3], items[1::3], items[2::3]):
+            key, eol, value = item.partition("\n")
+            key = config_key(key)
+            entries.setdefault(key, []).append(
+                GitConfigEntry(key, value if eol else None, scope, origin)
+            )
+        self._entries = entries
+        self._signature = self.signature()
+        return entries
 
-            def __setitem__(self, item: str, value: Any):
-                self.repo(["config", item, str(value)])
+    def __contains__(self, key: str) -> bool:
+        return config_key(key) in self.entries
 
-            def __contains__(self, item: str):
-                return item in self.repo(
-                    [
-                        "config",
-                        "--list",
-                        "--name-only",
-                    ]
-                ).split("\n")
+    def __getitem__(self, key: str) -> str:
+        entries = self.entries.get(config_key(key))
+        if not entries:
+            raise KeyError(key)
+        return entries[-1].value or ""
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self[key] if key in self else default
+
+    def get_all(self, key: str) -> list[str]:
+        return [e.value or "" for e in self.entries.get(config_key(key), [])]
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        self.update({key: value})
+
+    def update(self, values: dict[str, Any], scope: str = "local") -> list[str]:
+        """sets many keys in the scope config file (skipping the unchanged ones)
+
+        NOTE: git config sets a single key per run (there's no batch mode),
+        so each changed key is still a git process: only the unchanged keys
+        are skipped and the cache is reloaded once.
 
-        return X(self)
+        Returns:
+            list[str]: the keys actually written
+        """
+        changed = []
+        for key, value in values.items():
+            current = [
+                e.value
+                for e in self.entries.get(config_key(key), [])
+                if e.scope == scope
+            ]
+            if current[-1:] != [str(value)]:
+                changed.append(key)
+        try:
+            for key in changed:
+                self.repo(["config", f"--{scope}", key, str(values[key])])
+        finally:
+            if changed:
+                self.invalidate()
+        return changed
+
+
+class GitRepo(GitRepoBase):
+    @property
+    def config(self) -> GitRepoConfig:
+        if "_config" not in self.__dict__:
+            self._config = GitRepoConfig(self)
+        return self._config
 
     def revert(self, paths: ListOfArgs | None = None):
         sources = to_list_of_paths(paths or self.workdir)
         self(["checkout", *sources])
 
+    # restrict the backends (by name) for this repo, eg. ["cli"]
+    backends: list[str] | None = None
+
+    def backend(self, operation: str) -> Backend:
+        "the cheapest backend supporting operation (see select_backend)"
+        if "_backends" not in self.__dict__:
+            self._backends: dict[str, Backend] = {}
+        if operation not in self._backends:
+            klass = select_backend(self, operation, self.backends)
+            instances = {type(b): b for b in self._backends.values()}
+            self._backends[operation] = instances.get(klass) or klass(self)
+        return self._backends[operation]
+
     @property
-    def head(self):
-        name = self(["symbolic-ref", "HEAD"]).strip()
-        try:
-            txt = self(["rev-parse", name]).strip()
-        except subprocess.CalledProcessError as exc:
-            raise GitError(f"no branch '{name}'") from exc
-        return GitRepoHead(name=name, target=GitRepoHead.GitRepoHeadHex(txt))
+    def head(self) -> GitRepoHead:
+        return self.backend("head").head()
 
     def status(
         self,
         untracked_files: str = "all",
         ignored: bool = False,
     ) -> dict[str, int]:
-        # to update the mapping:
-        # pygit2.Repository(self.workdir).status()
-        mapper = {
-            "??": 128 if untracked_files == "all" else None,
-            " D": 512,
-            "D ": 4,
-            " M": 256,
-            "A ": 1,
-        }
-        result: dict[str, int] = {}
-        try:
-            txt = self(["status", "--porcelain"])
-        except subprocess.CalledProcessError as exc:
-            raise GitError("invalid repo") from exc
-        for line in txt.split("\n"):
-            if not line.strip():
-                continue
-            tag, filename = line[:2], line[3:]
-            if tag not in mapper:
-                raise GitError(f"cannot map git status for '{tag}'")
-            value = mapper[tag]
-            if value:
-                result[filename] = (
-                    (result[filename] | value) if filename in result else value
-                )
-        return result
+        return self.backend("status").status(untracked_files, ignored)
 
     def dirty(self) -> bool:
         return bool(self.status(untracked_files="no"))
@@ -202,25 +662,146 @@ class GitRepo(GitRepoBase):
 
     @property
     def branches(self) -> GitRepoBranches:
-        result = GitRepoBranches([], [])
-        for line in self(["branch", "-a", "--format", "%(refname)"]).split("\n"):
-            if not line.strip():
-                continue
-            if line.startswith("refs/heads/"):
-                result.local.append(line[11:])
-            elif line.startswith("refs/remotes/"):
-                result.remote.append(line[13:])
-            else:
-                raise RuntimeError(f"invalid branch {line}")
-        return result
+        return self.backend("branches").branches()
+
+    def iter_branches(
+        self,
+        patterns: list[str] | None = None,
+        remotes: bool | list[str] = True,
+        local: bool = True,
+    ) -> Iterator[GitBranch]:
+        """yields the branches (lazily, in refname order) matching patterns
+
+        The patterns are passed down to git for-each-ref, so only the
+        matching refs are read.
+
+        Args:
+            patterns: branch names or globs (eg. "beta/0.0.0", "beta/*"),
+                      None for all the branches
+            remotes: include the remote branches (True for all the remotes
+                     or a list of remote names)
+            local: include the local branches
+        """
+        prefixes = ["refs/heads"] if local else []
+        if remotes is True:
+            prefixes.append("refs/remotes/*" if patterns else "refs/remotes")
+        elif remotes:
+            prefixes.extend(f"refs/remotes/{remote}" for remote in remotes)
+        if not prefixes:
+            return
+        refs = (
+            [f"{prefix}/{name}" for prefix in prefixes for name in patterns]
+            if patterns
+            else prefixes
+        )
+        for line in self._lines(
+            ["for-each-ref", "--format=%(objectname) %(refname)", *refs]
+        ):
+            if line:
+                sha, _, ref = line.partition(" ")
+                yield GitBranch(ref, sha)
+
+    def branch_index(
+        self,
+        patterns: list[str] | None = None,
+        remotes: bool | list[str] = True,
+        local: bool = True,
+    ) -> GitBranchIndex:
+        "a compact sorted index of the iter_branches result"
+        return GitBranchIndex(self.iter_branches(patterns, remotes, local))
+
+    @property
+    def remotes(self) -> list[str]:
+        return [line.strip() for line in self(["remote"]).split("\n") if line.strip()]
+
+    def fetch(
+        self,
+        branches: list[str] | None = None,
+        remotes: list[str] | None = None,
+        tags: bool = True,
+        jobs: int | None = None,
+        max_age: float | None = None,
+    ) -> list[str]:
+        """fetch branches from remotes (one git process per remote, in parallel)
+
+        Args:
+            branches: branch names or globs (eg. "master", "beta/*") to fetch,
+                      None will use the refspecs configured for each remote
+                      (the names a remote doesn't have are skipped)
+            remotes: the remotes to fetch from (None for all)
+            tags: fetch tags too (when False it passes --no-tags)
+            jobs: max number of concurrent fetches
+            max_age: skip fetching if FETCH_HEAD is younger than max_age seconds
+
+        Returns:
+            list[str]: the remotes fetched
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        from functools import partial
+        from time import time
+
+        if max_age:
+            fetch_head = self.git_path("FETCH_HEAD")
+            if fetch_head.exists() and (time() - fetch_head.stat().st_mtime) < max_age:
+                return []
+
+        names = self.remotes if remotes is None else remotes
+        if not names:
+            return []
+
+        # (exact names are fetched only if the remote has them, as the globs)
+        exact = [n for n in branches or [] if not any(c in n for c in "*?[")]
+
+        def fetch(remote: str, append: bool = True) -> str:
+            wanted = branches or []
+            if exact:
+                heads = self(
+                    [
+                        "ls-remote",
+                        "--heads",
+                        remote,
+                        *(f"refs/heads/{n}" for n in exact),
+                    ]
+                )
+                found = {line.partition("\t")[2] for line in heads.split("\n")}
+                wanted = [
+                    n for n in wanted if n not in exact or f"refs/heads/{n}" in found
+                ]
+                if not wanted:
+                    return remote
+            progress = self.progress
+            # (the remote prefixes the progress lines)
+            run = (
+                partial(self.run, progress=lambda line: progress(f"{remote}: {line}"))
+                if progress
+                else self
+            )
+            run(
+                [
+                    "fetch",
+                    *(["--append"] if append else []),
+                    "--no-auto-gc",
+                    *([] if tags else ["--no-tags"]),
+                    remote,
+                    *[
+                        f"+refs/heads/{name}:refs/remotes/{remote}/{name}"
+                        for name in wanted
+                    ],
+                ]
+            )
+            return remote
+
+        # the first fetch resets FETCH_HEAD, the others append to it (as git
+        # fetch --multiple does)
+        fetch(names[0], append=False)
+        if len(names) == 1:
+            return names
+        with ThreadPoolExecutor(max_workers=jobs or len(names) - 1) as pool:
+            return [names[0], *pool.map(fetch, names[1:])]
 
     @property
     def references(self) -> list[str]:
-        return [
-            f"refs/tags/{line.strip()}"
-            for line in self(["tag", "-l"]).split("\n")
-            if line.strip()
-        ]
+        return self.backend("references").references()
 
     def clone(
         self,
@@ -246,19 +827,583 @@ class GitRepo(GitRepoBase):
         )
 
         repo = self.__class__(workdir=workdir)
-        repo(["config", "user.name", self(["config", "user.name"])])
-        repo(["config", "user.email", self(["config", "user.email"])])
+        repo.timeouts, repo.cancel, repo.progress = (
+            self.timeouts,
+            self.cancel,
+            self.progress,
+        )
+        keys = ["user.name", "user.email"]
+        repo.config.update({k: self.config[k] for k in keys if k in self.config})
 
         return repo
 
+    def rev_parse(self, name: str) -> str:
+        try:
+            return self(["rev-parse", "--verify", "--quiet", name]).strip()
+        except subprocess.CalledProcessError as exc:
+            raise GitError(f"cannot resolve '{name}'") from exc
+
+    def tree_hash(self, path: Path | str) -> str:
+        """the git tree sha of path (a directory) including the local changes
+
+        Without local changes it is HEAD:path, otherwise it's the tree sha
+        path would have once the changes (untracked files included) are
+        committed: the same sources give the same hash on any commit.
+        """
+        from tempfile import TemporaryDirectory
+
+        rel = Path(path).absolute().relative_to(self.workdir).as_posix()
+        prefix = "" if rel == "." else rel
+        # (-C: the paths are relative to the workdir, not to the process cwd)
+        top: list[str | Path] = ["-C", self.workdir]
+        changed = {
+            *self([*top, "diff", "--name-only", "-z", "HEAD", "--", rel]).split("\0"),
+            *self(
+                [
+                    *top,
+                    "ls-files",
+                    "-z",
+                    "--full-name",
+                    "--others",
+                    "--exclude-standard",
+                    "--",
+                    rel,
+                ]
+            ).split("\0"),
+        } - {""}
+        if not changed:
+            return self.rev_parse(f"HEAD:{prefix}")
+
+        with TemporaryDirectory() as tmpdir:
+            env = {"GIT_INDEX_FILE": str(Path(tmpdir) / "index")}
+            self(["read-tree", "HEAD"], env=env)
+            self(
+                [*top, "update-index", "--add", "--remove", "-z", "--stdin"],
+                input="\0".join(sorted(changed)) + "\0",
+                env=env,
+            )
+            prefixes = [f"--prefix={prefix}/"] if prefix else []
+            return self(["write-tree", *prefixes], env=env).strip()
+
+    @property
+    def commondir(self) -> Path:
+        "the git directory shared by all the worktrees (objects, refs etc.)"
+        return DiskBackend(self).commondir
+
+    def merge_base(self, first: str, second: str) -> str | None:
+        try:
+            return self(["merge-base", first, second]).strip()
+        except subprocess.CalledProcessError:
+            return None
+
+    def last_tag(self, patterns: list[str], commit: str = "HEAD") -> str | None:
+        "the most recent tag (matching one of the glob patterns) reachable from commit"
+        matches = [arg for pattern in patterns for arg in ["--match", pattern]]
+        try:
+            return self(["describe", "--tags", "--abbrev=0", *matches, commit]).strip()
+        except subprocess.CalledProcessError:
+            return None
+
+    def commit_graph(self) -> bool:
+        "writes the commit-graph file if missing (returns True if written)"
+        info = self.commondir / "objects" / "info"
+        if (info / "commit-graph").exists():
+            return False
+        if (info / "commit-graphs" / "commit-graph-chain").exists():
+            return False
+        self(["commit-graph", "write", "--reachable"])
+        return True
+
+    def count_commits(self, head: str = "HEAD", base: str | None = None) -> int:
+        """the number of commits reachable from head and not from base
+
+        The history walk uses the commit-graph (written if missing) and the
+        results are memoized by (base, head) sha in the git directory.
+        """
+        import json
+
+        try:
+            names = [head, *([base] if base else [])]
+            shas = self(["rev-parse", *(f"{n}^{{commit}}" for n in names)]).split()
+        except subprocess.CalledProcessError as exc:
+            raise GitError(f"cannot resolve '{head}' or '{base}'") from exc
+        key = "..".join(reversed(shas))
+
+        path = self.commondir / "setuptools-github-counts.json"
+        try:
+            memo = json.loads(path.read_text())
+        except (OSError, ValueError):
+            memo = {}
+        if key in memo:
+            return int(memo[key])
+
+        self.commit_graph()
+        count = int(self(["rev-list", "--count", key]).strip())
+
+        # the newest entries last, keeping it small
+        memo = {k: v for k, v in memo.items() if k != key}
+        memo = dict([*list(memo.items())[-255:], (key, count)])
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(memo))
+        tmp.replace(path)
+        return count
+
+    def is_ancestor(self, ancestor: str, commit: str) -> bool:
+        try:
+            self(["merge-base", "--is-ancestor", ancestor, commit])
+        except subprocess.CalledProcessError as exc:
+            if exc.returncode == 1:
+                return False
+            raise
+        return True
+
+    def write_tree(self, base: str, files: dict[str, Path]) -> str:
+        """writes a new tree object (base with files replaced)
+
+        The worktree and the index are not touched (a temporary index is used).
+
+        Args:
+            base: the tree-ish to start from
+            files: map of repo relative paths (posix) to the files with
+                   the new content
+
+        Returns:
+            str: the sha of the new tree
+        """
+        from tempfile import TemporaryDirectory
+
+        paths = sorted(files)
+        blobs = self(
+            ["hash-object", "-w", "--stdin-paths"],
+            input="".join(f"{files[path]}\n" for path in paths),
+        ).split()
+
+        modes = {}
+        # (-C: paths are relative to the workdir, not to the process cwd)
+        tree = self(["-C", self.workdir, "ls-tree", "-z", base, "--", *paths])
+        for entry in tree.split("\0"):
+            if entry:
+                info, _, path = entry.partition("\t")
+                modes[path] = info.split()[0]
+
+        with TemporaryDirectory() as tmpdir:
+            env = {"GIT_INDEX_FILE": str(Path(tmpdir) / "index")}
+            self(["read-tree", base], env=env)
+            self(
+                ["update-index", "--add", "--index-info"],
+                input="".join(
+                    f"{modes.get(path, '100644')} {blob}\t{path}\n"
+                    for path, blob in zip(paths, blobs)
+                ),
+                env=env,
+            )
+            return self(["write-tree"], env=env).strip()
+
+    def commit_tree(self, tree: str, parents: list[str], message: str) -> str:
+        arguments = ["commit-tree", tree]
+        for parent in parents:
+            arguments.extend(["-p", parent])
+        return self([*arguments, "-m", message]).strip()
+
+    def merge_tree(self, ours: str, theirs: str) -> str:
+        "merges two commits without touching the worktree, returns the tree sha"
+        try:
+            return self(["merge-tree", "--write-tree", ours, theirs]).split()[0]
+        except subprocess.CalledProcessError as exc:
+            raise GitError(f"cannot merge {theirs} into {ours} (conflicts)") from exc
+
+    def mktag(self, name: str, target: str, message: str) -> str:
+        "creates an annotated tag object (without the ref) and returns its sha"
+        tagger = self(["var", "GIT_COMMITTER_IDENT"]).strip()
+        return self(
+            ["mktag"],
+            input=(
+                f"object {target}\n"
+                f"type {self(['cat-file', '-t', target]).strip()}\n"
+                f"tag {name}\n"
+                f"tagger {tagger}\n"
+                f"\n"
+                f"{message}\n"
+            ),
+        ).strip()
+
+    def update_refs(
+        self, updates: list[tuple[str, str, str | None]], message: str = ""
+    ) -> None:
+        """updates refs in a single (all or nothing) transaction
+
+        Args:
+            updates: a list of (ref, new, old) tuples, old is the expected
+                     current value of ref (None if ref must not exist)
+            message: the reflog message
+        """
+        lines = []
+        for ref, new, old in updates:
+            if old is None:
+                lines.append(f"create {ref} {new}\n")
+            else:
+                lines.append(f"update {ref} {new} {old}\n")
+        try:
+            self(
+                ["update-ref", *(["-m", message] if message else []), "--stdin"],
+                input="".join(lines),
+            )
+        except subprocess.CalledProcessError as exc:
+            raise GitError(f"cannot update refs {[u[0] for u in updates]}") from exc
+
+
+class Backend(ABC):
+    """the git operations used by tools.get_data and script.main
+
+    All the backends implement head, branches and references, status is
+    optional (see operations): select_backend picks the cheapest available
+    one for each operation. They raise GitError on failures (eg. a detached
+    HEAD or a branch without commits).
+
+    NOTE: cheapest is a fixed ranking (the cost attribute) of how each backend
+    works, not a measurement: on a given repo (eg. huge packed-refs) another
+    backend might be faster, set GitRepo.backends or SETUPTOOLS_GITHUB_BACKENDS
+    to pick one.
+    """
+
+    name = ""
+    operations: frozenset[str] = frozenset()
+    # the relative cost of an operation (in-process < file reads < fork+exec)
+    cost = 0
+
+    def __init__(self, repo: GitRepo):
+        self.repo = repo
+
+    @classmethod
+    def available(cls, repo: GitRepo) -> bool:
+        return True
+
+    @abstractmethod
+    def head(self) -> GitRepoHead: ...
+
+    @abstractmethod
+    def branches(self) -> GitRepoBranches: ...
+
+    @abstractmethod
+    def references(self) -> list[str]: ...
+
+    def status(
+        self, untracked_files: str = "all", ignored: bool = False
+    ) -> dict[str, int]:
+        "the optional status operation (listed in operations if supported)"
+        raise NotImplementedError(f"{self.name} backend doesn't support status")
+
+
+class CliBackend(Backend):
+    "runs the git command line (in a subprocess)"
+
+    name = "cli"
+    operations = frozenset({"head", "status", "branches", "references"})
+    cost = 2
+
+    def head(self) -> GitRepoHead:
+        try:
+            name = self.repo(["symbolic-ref", "-q", "HEAD"]).strip()
+        except subprocess.CalledProcessError as exc:
+            raise GitError("detached HEAD") from exc
+        try:
+            txt = self.repo(["rev-parse", name]).strip()
+        except subprocess.CalledProcessError as exc:
+            raise GitError(f"no branch '{name}'") from exc
+        return GitRepoHead(name=name, target=GitRepoHead.GitRepoHeadHex(txt))
+
+    def status(
+        self, untracked_files: str = "all", ignored: bool = False
+    ) -> dict[str, int]:
+        # to update the mapping:
+        # pygit2.Repository(self.workdir).status()
+        mapper = {
+            "??": 128,
+            " D": 512,
+            "D ": 4,
+            " M": 256,
+            "A ": 1,
+            "M ": 2,
+            "MM": 258,
+            "AM": 257,
+            "MD": 514,
+            "AD": 513,
+        }
+        result: dict[str, int] = {}
+        cmd: list[str | Path] = [
+            "status",
+            "--porcelain",
+            "-z",
+            f"--untracked-files={untracked_files}",
+        ]
+        try:
+            # (-z: the paths are not quoted)
+            lines = [os.fsdecode(record) for record in self.repo.stream(cmd)]
+        except subprocess.CalledProcessError as exc:
+            raise GitError("invalid repo") from exc
+        for line in lines:
+            if not line.strip():
+                continue
+            tag, filename = line[:2], line[3:]
+            if tag not in mapper:
+                raise GitError(f"cannot map git status for '{tag}'")
+            value = mapper[tag]
+            result[filename] = (
+                (result[filename] | value) if filename in result else value
+            )
+        return result
+
+    def branches(self) -> GitRepoBranches:
+        result = GitRepoBranches([], [])
+        cmd: list[str | Path] = ["branch", "-a", "--format", "%(refname)"]
+        for line in map(os.fsdecode, self.repo.stream(cmd, b"\n")):
+            if not line.strip():
+                continue
+            if line.startswith("refs/heads/"):
+                result.local.append(line[11:])
+            elif line.startswith("refs/remotes/"):
+                result.remote.append(line[13:])
+            else:
+                raise RuntimeError(f"invalid branch {line}")
+        return result
+
+    def references(self) -> list[str]:
+        return [
+            f"refs/tags/{line.strip()}"
+            for line in map(os.fsdecode, self.repo.stream(["tag", "-l"], b"\n"))
+            if line.strip()
+        ]
+
+
+class DiskBackend(Backend):
+    """reads the refs straight from the git directory (loose refs and packed-refs)
+
+    Not available for the other ref storages (eg. reftable).
+    """
+
+    name = "disk"
+    operations = frozenset({"head", "branches", "references"})
+    cost = 1
+
+    def __init__(self, repo: GitRepo):
+        super().__init__(repo)
+        gitdir = repo.gitdir
+        if gitdir.is_file():
+            # linked worktrees (and submodules) have a gitfile
+            gitdir = gitdir.parent / gitdir.read_text().partition("gitdir:")[2].strip()
+        self.gitdir = gitdir.absolute()
+        commondir = self.gitdir / "commondir"
+        self.commondir = (
+            (self.gitdir / commondir.read_text().strip()).resolve()
+            if commondir.exists()
+            else self.gitdir
+        )
+
+    @classmethod
+    def available(cls, repo: GitRepo) -> bool:
+        return repo.gitdir.exists() and cls(repo).ref_storage() == "files"
+
+    def ref_storage(self) -> str:
+        "the refs storage format (files, reftable etc.) from extensions.refStorage"
+        # (reftable repos keep a dummy HEAD for the older gits)
+        head = self.gitdir / "HEAD"
+        if head.exists() and head.read_text().strip() == "ref: refs/heads/.invalid":
+            return "reftable"
+        config = self.commondir / "config"
+        section = ""
+        for line in config.read_text().split("\n") if config.exists() else []:
+            line = line.split("#")[0].split(";")[0].strip()
+            if line.startswith("["):
+                section = line[1:].partition("]")[0].strip().lower()
+                continue
+            key, _, value = line.partition("=")
+            if section == "extensions" and key.strip().lower() == "refstorage":
+                return value.strip().strip('"').lower()
+        return "files"
+
+    def head_files(self) -> list[Path]:
+        """the files changed when HEAD moves: HEAD and the index (per worktree),
+        the current branch ref and packed-refs (shared by the worktrees)"""
+        head = self.gitdir / "HEAD"
+        txt = head.read_text().strip() if head.exists() else ""
+        result = [head, self.gitdir / "index", self.commondir / "packed-refs"]
+        if txt.startswith("ref:"):
+            result.append(self.commondir / txt[4:].strip())
+        return result
 
-def lookup(path: Path) -> GitRepo | None:
-    cur = path
-    found = False
-    while not found:
+    def packed(self) -> dict[str, str]:
+        result = {}
+        path = self.commondir / "packed-refs"
+        if path.exists():
+            for line in path.read_text().split("\n"):
+                if not line or line[0] in "#^":
+                    continue
+                sha, _, name = line.partition(" ")
+                result[name] = sha
+        return result
+
+    def refs(self, prefix: str) -> list[str]:
+        "all the refs names under prefix (eg. refs/heads/)"
+        names = {name for name in self.packed() if name.startswith(prefix)}
+        base = self.commondir / prefix
+        if base.is_dir():
+            for path in base.rglob("*"):
+                if path.is_file() and not path.name.endswith(".lock"):
+                    names.add(prefix + path.relative_to(base).as_posix())
+        return sorted(names)
+
+    def resolve(self, name: str) -> str | None:
+        for gitdir in [self.gitdir, self.commondir]:
+            path = gitdir / name
+            if path.is_file():
+                txt = path.read_text().strip()
+                return self.resolve(txt[4:].strip()) if txt.startswith("ref:") else txt
+        return self.packed().get(name)
+
+    def head(self) -> GitRepoHead:
+        txt = (self.gitdir / "HEAD").read_text().strip()
+        if not txt.startswith("ref:"):
+            raise GitError("detached HEAD")
+        name = txt[4:].strip()
+        if not (sha := self.resolve(name)):
+            raise GitError(f"no branch '{name}'")
+        return GitRepoHead(name=name, target=GitRepoHead.GitRepoHeadHex(sha))
+
+    def branches(self) -> GitRepoBranches:
+        return GitRepoBranches(
+            [name[11:] for name in self.refs("refs/heads/")],
+            [name[13:] for name in self.refs("refs/remotes/")],
+        )
+
+    def references(self) -> list[str]:
+        return self.refs("refs/tags/")
+
+
+class Pygit2Backend(Backend):
+    "uses libgit2 in-process (if pygit2 is installed)"
+
+    name = "pygit2"
+    operations = frozenset({"head", "status", "branches", "references"})
+    cost = 0
+
+    def __init__(self, repo: GitRepo):
+        import pygit2  # type: ignore
+
+        super().__init__(repo)
+        self.pygit2 = pygit2
+        # GIT_REPOSITORY_OPEN_NO_SEARCH: no parent dirs lookup (as with --git-dir)
+        flags: Any = 1
+        try:
+            self.impl = pygit2.Repository(str(repo.workdir), flags)
+        except pygit2.GitError as exc:
+            raise InvalidGitRepoError(f"invalid repo {repo.workdir}") from exc
+
+    @classmethod
+    def available(cls, repo: GitRepo) -> bool:
+        from importlib.util import find_spec
+
+        return bool(find_spec("pygit2")) and repo.gitdir == repo.workdir / ".git"
+
+    def head(self) -> GitRepoHead:
+        if self.impl.head_is_unborn:
+            raise GitError(f"no branch '{self.impl.references['HEAD'].target}'")
+        if self.impl.head_is_detached:
+            raise GitError("detached HEAD")
+        head = self.impl.head
+        return GitRepoHead(
+            name=head.name, target=GitRepoHead.GitRepoHeadHex(str(head.target))
+        )
+
+    def status(
+        self, untracked_files: str = "all", ignored: bool = False
+    ) -> dict[str, int]:
+        # the flags the cli backend can map
+        known = 1 | 2 | 4 | 128 | 256 | 512
+        result = {}
+        for path, flags in self.impl.status(
+            untracked_files=untracked_files, ignored=ignored
+        ).items():
+            if flags & ~known:
+                raise GitError(f"cannot map git status for '{flags}'")
+            result[path] = int(flags)
+        return result
+
+    def branches(self) -> GitRepoBranches:
+        return GitRepoBranches(
+            sorted(self.impl.branches.local), sorted(self.impl.branches.remote)
+        )
+
+    def references(self) -> list[str]:
+        return sorted(
+            ref for ref in self.impl.references if ref.startswith("refs/tags/")
+        )
+
+
+BACKENDS: list[type[Backend]] = [CliBackend, DiskBackend, Pygit2Backend]
+
+
+def select_backend(
+    repo: GitRepo, operation: str, names: list[str] | None = None
+) -> type[Backend]:
+    """the cheapest backend available for repo supporting operation
+
+    The backends are ranked by their (fixed) cost attribute, see Backend.
+
+    Args:
+        repo: the git repo
+        operation: one of head, status, branches or references
+        names: restrict the choice to these backends (default to the
+               SETUPTOOLS_GITHUB_BACKENDS comma separated list, or all)
+    """
+    if names is None and os.getenv("SETUPTOOLS_GITHUB_BACKENDS"):
+        names = os.getenv("SETUPTOOLS_GITHUB_BACKENDS", "").split(",")
+    candidates = [
+        klass
+        for klass in sorted(BACKENDS, key=lambda k: k.cost)
+        if operation in klass.operations
+        and (names is None or klass.name in names)
+        and klass.available(repo)
+    ]
+    if not candidates:
+        raise GitError(f"no backend available for '{operation}' ({names=})")
+    return candidates[0]
+
+
+def lookup(
+    path: Path,
+    cache: dict[Path, GitRepo | None] | None = None,
+    ceiling: str | Path | None = None,
+) -> GitRepo | None:
+    """finds the git repo containing path (walking up to the root)
+
+    Args:
+        path: the starting directory
+        cache: a dict shared across calls, mapping the visited dirs to the
+               repo found (or None), to use with the same ceiling
+        ceiling: the topmost directory searched (eg. the project root), the
+               walk also stops before the $GIT_CEILING_DIRECTORIES (as git does)
+    """
+    stops = {
+        Path(p).absolute()
+        for p in os.getenv("GIT_CEILING_DIRECTORIES", "").split(os.pathsep)
+        if p
+    }
+    top = Path(ceiling).absolute() if ceiling else None
+
+    cur = Path(path).absolute()
+    visited = []
+    result = None
+    while True:
+        if cache is not None and cur in cache:
+            result = cache[cur]
+            break
+        visited.append(cur)
         if (cur / ".git").exists():
-            return GitRepo(cur)
-        if str(cur) == cur.root:
+            result = GitRepo(cur)
+            break
+        if str(cur) == cur.root or cur == top or cur.parent in stops:
             break
         cur = cur.parent
-    return None
+    if cache is not None:
+        cache.update((d, result) for d in visited)
+    return result
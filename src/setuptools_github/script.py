@@ -8,18 +8,69 @@ Or will release the beta branch and will move inot the next minor
 
     setuptools-github {major|minor|micro} ./src/package_name/__init__.py
 
+With many version files (or a --manifest) it works in monorepo mode, from
+the master branch, creating <name>/beta/N.M.O branches or releasing them
+(tagged <name>/release/N.M.O) into master, bumping all versions in a single
+commit.
+
+The report mode prints (as json lines) the tools.get_data results for
+many version files, even across repositories:
+
+    setuptools-github report */src/*/__init__.py
+
+The serve mode starts a daemon answering the tools.process version
+queries (see the daemon module):
+
+    setuptools-github serve [--socket PATH]
+
+The maintain mode keeps the repository git queries fast (see the
+maintain module):
+
+    setuptools-github maintain [--midx]
+
+The changelog mode prints the commits for each release (and the
+current beta branch):
+
+    setuptools-github changelog
+
+The watch mode keeps the record (and the --template files, rendered in
+--outdir) up to date as HEAD changes (see the watch module):
+
+    setuptools-github watch ./src/package_name/__init__.py --template README.md \\
+        --outdir build/watch --fixer "[master]=[{{ ctx.branch }}]"
+
+The install-hooks mode installs git hooks keeping a context file, used
+by tools.get_data to skip the git queries (see the hooks module):
+
+    setuptools-github install-hooks ./src/package_name/__init__.py
+
+The update-context mode rewrites the context file by hand (eg. after a
+git reset --soft or update-ref, which don't run the hooks):
+
+    setuptools-github update-context ./src/package_name/__init__.py
+
 """
 from __future__ import annotations
 
-import argparse
-import logging
 import re
 import sys
+from contextlib import contextmanager
 from pathlib import Path
+from typing import TYPE_CHECKING
+
+# (--help shouldn't pay for the git and release machinery)
+from . import cli, tools
+
+if TYPE_CHECKING:
+    import argparse
+    from typing import Iterator
+
+    from . import scm
 
-from . import cli, scm, tools
+log = cli.LazyLogger(__name__)
 
-log = logging.getLogger(__name__)
+# the release.ENGINES names
+ENGINES = ["checkout", "plumbing", "worktree"]
 
 
 def add_arguments(parser: argparse.ArgumentParser):
@@ -31,15 +82,136 @@ def add_arguments(parser: argparse.ArgumentParser):
         default=Path("."),
         type=Path,
     )
-    parser.add_argument("mode", choices=["micro", "minor", "major", "make-beta"])
-    parser.add_argument("initfile", metavar="__init__.py", type=Path)
+    parser.add_argument(
+        "--no-fetch",
+        "--offline",
+        dest="fetch",
+        action="store_false",
+        help="don't fetch from the remotes",
+    )
+    parser.add_argument(
+        "--fetch-all",
+        action="store_true",
+        help="fetch all branches and tags from all remotes",
+    )
+    parser.add_argument(
+        "--fetch-jobs",
+        type=int,
+        default=4,
+        help="number of remotes fetched in parallel",
+    )
+    parser.add_argument(
+        "--fetch-max-age",
+        type=float,
+        default=0,
+        metavar="SECONDS",
+        help="reuse the last fetch if FETCH_HEAD is younger than this",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=ENGINES,
+        default="checkout",
+        help="how to release: in the working dir (checkout), without touching "
+        "it (plumbing) or in a temporary sparse worktree (worktree)",
+    )
+    parser.add_argument(
+        "--manifest",
+        type=Path,
+        help="file listing the version files (one per line) for the monorepo mode",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        help="max number of worker processes (report mode)",
+    )
+    parser.add_argument(
+        "--process",
+        action="store_true",
+        help="run tools.process (updating the version files) in report mode",
+    )
+    parser.add_argument(
+        "--socket",
+        type=Path,
+        help="the daemon unix socket (serve mode)",
+    )
+    parser.add_argument(
+        "--midx",
+        action="store_true",
+        help="write a multi-pack-index too (maintain mode)",
+    )
+    parser.add_argument(
+        "--template",
+        dest="templates",
+        action="append",
+        type=Path,
+        help="a templated file to keep rendered (watch mode, repeatable)",
+    )
+    parser.add_argument(
+        "--outdir",
+        type=Path,
+        help="where the templates are rendered (watch mode)",
+    )
+    parser.add_argument(
+        "--fixer",
+        dest="fixers",
+        action="append",
+        metavar="OLD=NEW",
+        help="replace OLD with NEW in the templates before rendering "
+        "(watch mode, repeatable, see tools.apply_fixers)",
+    )
+    parser.add_argument(
+        "--poll",
+        type=float,
+        default=0,
+        metavar="SECONDS",
+        help="poll for changes instead of using inotify (watch mode)",
+    )
+    parser.add_argument(
+        "--timeout",
+        dest="timeouts",
+        action="append",
+        metavar="[VERB=]SECONDS",
+        help="terminate the git VERB (fetch, clone, merge by default) after "
+        "SECONDS (repeatable, see scm.TIMEOUTS_ENV)",
+    )
+    parser.add_argument(
+        "--progress",
+        action="store_true",
+        help="show the git fetch/clone/merge progress",
+    )
+    parser.add_argument(
+        "mode",
+        choices=[
+            "micro",
+            "minor",
+            "major",
+            "make-beta",
+            "report",
+            "serve",
+            "maintain",
+            "changelog",
+            "watch",
+            "install-hooks",
+            "update-context",
+        ],
+    )
+    parser.add_argument("initfiles", metavar="__init__.py", type=Path, nargs="*")
 
 
 def process_options(
     options: argparse.Namespace, error: cli.ErrorFn
 ) -> argparse.Namespace:
+    from . import scm
+
+    if options.mode in {"report", "serve"}:
+        return options
     try:
         options.repo = repo = scm.GitRepo(options.workdir)
+        timeouts = getattr(options, "timeouts", None) or []
+        repo.timeouts.update(scm.parse_timeouts(timeouts))
+        if getattr(options, "progress", False):
+            repo.progress = show_progress
         repo.status()
     except scm.GitError:
         error(
@@ -61,20 +233,223 @@ def process_options(
               """,
             hint="create a git branch",
         )
+    options.initfile = options.initfiles[0] if options.initfiles else None
+    if options.mode in {"maintain", "changelog"}:
+        return options
+    if not (options.initfiles or options.manifest):
+        error(
+            "missing version file",
+            "no version file or manifest given",
+            hint="pass a __init__.py file or a --manifest",
+        )
     return options
 
 
+def show_progress(line: str) -> None:
+    "prints the git --progress lines (overwriting the last one on a terminal)"
+    if sys.stderr.isatty():
+        sys.stderr.write(f"\r\x1b[K{line}")
+    else:
+        sys.stderr.write(f"{line}\n")
+    sys.stderr.flush()
+
+
+@contextmanager
+def cancel_on_signals(repo: scm.GitRepo) -> Iterator[None]:
+    "SIGINT/SIGTERM terminate the running git commands (and abort)"
+    import signal
+    import threading
+
+    def handler(signum, frame):
+        repo.cancel.set()
+        if signum == signal.SIGINT:
+            raise KeyboardInterrupt
+        raise SystemExit(128 + signum)
+
+    repo.cancel = threading.Event()
+    signums = [signal.SIGINT, signal.SIGTERM]
+    previous = {signum: signal.signal(signum, handler) for signum in signums}
+    try:
+        yield
+    finally:
+        for signum, value in previous.items():
+            signal.signal(signum, value)
+        repo.cancel = None
+
+
+def load_manifest(path: Path | None) -> list[Path]:
+    "reads the version files listed in path (relative to the path directory)"
+    if not path:
+        return []
+    result = []
+    for line in path.read_text().split("\n"):
+        line = line.partition("#")[0].strip()
+        if line:
+            result.append(path.parent / line)
+    return result
+
+
+def fetch(options: argparse.Namespace, branches: list[str]) -> None:
+    if not options.fetch:
+        return
+    with cancel_on_signals(options.repo):
+        fetched = options.repo.fetch(
+            None if options.fetch_all else branches,
+            tags=options.fetch_all,
+            jobs=options.fetch_jobs,
+            max_age=options.fetch_max_age,
+        )
+    log.info("fetched remotes: %s", ", ".join(fetched) or "(none)")
+
+
+def monorepo(options: argparse.Namespace, master: str, initfiles: list[Path]) -> None:
+    from . import release
+
+    packages = []
+    for initfile in initfiles:
+        if not initfile.exists():
+            options.error(f"cannot find version file {initfile}")
+        version = tools.get_module_var(initfile, "__version__")
+        if not version:
+            raise tools.InvalidVersionError(f"cannot find a version in {initfile}")
+        packages.append(
+            release.Package(initfile.absolute().parent.name, initfile, version)
+        )
+
+    names = [package.name for package in packages]
+    if duplicates := sorted({name for name in names if names.count(name) > 1}):
+        options.error(f"duplicate package names {', '.join(duplicates)}")
+
+    if options.repo.head.name != f"refs/heads/{master}":
+        options.error(f"wrong branch '{options.repo.head.name}', expected '{master}'")
+
+    fetch(options, [master, *(f"{name}/beta/*" for name in names)])
+
+    # validate all the packages against a single snapshot
+    if options.mode == "make-beta":
+        found = list(options.repo.iter_branches([p.beta for p in packages]))
+        for package in packages:
+            for branch in found:
+                if branch.name.endswith(package.beta):
+                    options.error(f"branch '{branch.name}' already present")
+        with cancel_on_signals(options.repo):
+            updates = release.make_betas(options.repo, packages, master)
+    else:
+        present = set(options.repo.references)
+        betas = {
+            branch.name
+            for branch in options.repo.iter_branches(
+                [p.beta for p in packages], remotes=False
+            )
+        }
+        for package in packages:
+            if package.beta not in betas:
+                options.error(f"cannot find branch '{package.beta}'")
+            if f"refs/tags/{package.tag}" in present:
+                options.error(f"tag '{package.tag}' already present")
+            package.new_version = tools.bump_version(package.version, options.mode)
+        with cancel_on_signals(options.repo):
+            updates = release.release_packages(options.repo, packages, master)
+
+    width = max(len(name) for name in names)
+    lines = [
+        f"{package.name:{width}}  {package.version} -> "
+        + (package.beta if options.mode == "make-beta" else package.new_version)
+        for package in packages
+    ]
+    revert = [
+        f"git update-ref {ref} {old}" if old else f"git update-ref -d {ref}"
+        for ref, _, old in updates
+    ]
+    print(  # noqa: T201
+        "\n".join(
+            [
+                f"Processed {len(packages)} packages ({options.mode}):",
+                tools.indent("\n".join(lines), pre=" " * 4),
+                "",
+                "To revert:",
+                tools.indent("\n".join(revert), pre=" " * 4),
+            ]
+        ),
+        file=sys.stderr,
+    )
+
+
+def report(options: argparse.Namespace) -> None:
+    from json import dumps
+
+    from . import batch
+
+    initfiles = [*(options.initfiles or []), *load_manifest(options.manifest)]
+    for result in batch.get_data_many(
+        initfiles, process=options.process, workers=options.jobs
+    ):
+        print(dumps(result, sort_keys=True), flush=True)  # noqa: T201
+
+
 @cli.cli(add_arguments, process_options, __doc__)
 def main(options) -> None:
+    if options.mode == "report":
+        report(options)
+        return
+    if options.mode == "serve":
+        from . import daemon
+
+        log.info("serving on %s", options.socket or daemon.socket_path())
+        daemon.serve(options.socket)
+        return
+    if options.mode == "maintain":
+        from . import maintain
+
+        before = maintain.timings(options.repo)
+        steps = maintain.maintain(options.repo, options.midx)
+        after = maintain.timings(options.repo)
+        print(maintain.report(steps, before, after), file=sys.stderr)  # noqa: T201
+        return
+    if options.mode == "changelog":
+        from . import changelog
+
+        print(changelog.render(changelog.sections(options.repo)))  # noqa: T201
+        return
+    if options.mode in {"install-hooks", "update-context"}:
+        from . import hooks
+
+        initfiles = [*(options.initfiles or []), *load_manifest(options.manifest)]
+        if options.mode == "install-hooks":
+            for path in hooks.install(options.repo, initfiles):
+                log.info("installed %s", path)
+        else:
+            for initfile in initfiles:
+                hooks.write_context(options.repo, initfile)
+        return
+    if options.mode == "watch":
+        from . import watch
+
+        fixers = dict(fixer.partition("=")[::2] for fixer in options.fixers or [])
+        watcher = watch.Watcher(
+            options.initfile,
+            options.templates,
+            fixers=fixers,
+            outdir=options.outdir,
+        )
+        log.info("watching %s", options.repo.workdir)
+        try:
+            watch.watch(watcher, options.poll)
+        except KeyboardInterrupt:
+            pass
+        return
+
     # master branch
-    master = options.master or (
-        options.repo.config["init.defaultbranch"]
-        if "init.defaultbranch" in options.repo.config
-        else "master"
-    )
+    master = options.master or options.repo.config.get("init.defaultbranch", "master")
 
     if options.repo.status(untracked_files="no", ignored=False):
         options.error(f"modified files in {options.repo.workdir}")
+
+    initfiles = [*(options.initfiles or []), *load_manifest(options.manifest)]
+    if options.manifest or len(initfiles) > 1:
+        monorepo(options, master, initfiles)
+        return
+
     if not options.initfile.exists():
         options.error(f"cannot find version file {options.initfile}")
 
@@ -83,8 +458,8 @@ def main(options) -> None:
     if not version:
         raise tools.InvalidVersionError(f"cannot find a version in {options.initfile}")
 
-    # fetching all remotes
-    options.repo(["fetch", "--all"])
+    # fetching the remotes (only the master and beta/* branches by default)
+    fetch(options, [master, "beta/*"])
 
     if options.mode == "make-beta":
         if options.repo.head.name != f"refs/heads/{master}":
@@ -92,15 +467,13 @@ def main(options) -> None:
                 f"wrong branch '{options.repo.head.name}', expected '{master}'"
             )
 
-        for branch in [*options.repo.branches.local, *options.repo.branches.remote]:
-            if not branch.endswith(f"beta/{version}"):
-                continue
-            options.error(f"branch '{branch}' already present")
+        # (only the matching refs are read, the mirrors have lots of them)
+        for branch in options.repo.iter_branches([f"beta/{version}"]):
+            options.error(f"branch '{branch.name}' already present")
         log.info("creating branch '%s'", f"/beta/{version}")
         options.repo.branch(f"beta/{version}", master)
         print(  # noqa: T201
-            tools.indent(
-                f"""
+            tools.indent(f"""
         The release branch beta/{version} has been created.
 
         To complete the release:
@@ -108,11 +481,12 @@ def main(options) -> None:
 
         To revert this beta branch:
             git branch -D beta/{version}
-        """
-            ),
+        """),
             file=sys.stderr,
         )
     elif options.mode in {"micro", "minor", "major"}:
+        from . import release
+
         # we need to be in the beta/N.M.O branch
         expr = re.compile(r"refs/heads/beta/(?P<beta>\d+([.]\d+)*)$")
         if not (match := expr.search(options.repo.head.name)):
@@ -126,39 +500,29 @@ def main(options) -> None:
         if local != version:
             options.error(f"wrong version file {version=} != {local}")
 
-        # create an empty commit to mark the release
-        options.repo(["commit", "--allow-empty", "-m", f"released {version}"])
-
-        # tag
-        options.repo(["tag", "-a", f"release/{version}", "-m", f"released {version}"])
-
-        # switch to master (and incorporate the commit message)
-        options.repo(["checkout", master])
-        options.repo(["merge", f"beta/{version}"])
-
-        # bump version
         new_version = tools.bump_version(version, options.mode)
-        tools.set_module_var(options.initfile, "__version__", new_version)
-
-        # commit
-        options.repo.commit(
-            options.initfile, f"version bump {version} -> {new_version}"
-        )
+        with cancel_on_signals(options.repo):
+            result = release.ENGINES[options.engine](
+                options.repo, options.initfile, version, new_version, master
+            )
 
+        # (the checkout engine doesn't report the updated refs)
+        revert = ["git reset --hard HEAD~1", f"git tag -d release/{version}"]
+        if result.updates:
+            revert = [
+                f"git update-ref {ref} {old}" if old else f"git update-ref -d {ref}"
+                for ref, _, old in result.updates
+            ]
         print(  # noqa: T201
-            tools.indent(
-                f"""
+            tools.indent(f"""
         The release is almost complete.
 
         To complete the release:
             git push origin release/{version}
-            git push origin master
+            git push origin {master}
 
         To revert this release:
-            git reset --hard HEAD~1
-            git tag -d release/{version}
-        """
-            ),
+        """) + tools.indent("\n".join(revert), pre=" " * 6),
             file=sys.stderr,
         )
     else:
@@ -1,12 +1,14 @@
 from __future__ import annotations
 
-import ast
-import json
 import re
 from pathlib import Path
-from typing import Any
+from typing import TYPE_CHECKING
 
-from . import scm
+# setup.py imports this module: keep the imports (ast, json, scm etc.) lazy
+if TYPE_CHECKING:
+    from typing import Any, Callable
+
+    from . import scm
 
 
 class ToolsError(Exception):
@@ -93,6 +95,19 @@ def list_of_paths(paths: str | Path | list[str | Path] | None) -> list[Path]:
     return [Path(s) for s in ([paths] if isinstance(paths, (str, Path)) else paths)]
 
 
+def output_paths(
+    paths: str | Path | list[str | Path] | None, outdir: str | Path
+) -> dict[Path, Path]:
+    "maps paths to outdir (keeping their layout relative to their common parent)"
+    import os
+
+    sources = [p.absolute() for p in list_of_paths(paths)]
+    if not sources:
+        return {}
+    parent = Path(os.path.commonpath([p.parent for p in sources]))
+    return {p: Path(outdir) / p.relative_to(parent) for p in sources}
+
+
 def lstrip(txt: str, left: str) -> str:
     return txt[len(left) :] if txt.startswith(left) else txt
 
@@ -119,6 +134,23 @@ def apply_fixers(txt: str, fixers: dict[str, str] | None = None) -> str:
     return result
 
 
+def is_template(txt: str) -> bool:
+    "True if txt has jinja2 syntax ({{, {% or {#)"
+    return "{{" in txt or "{%" in txt or "{#" in txt
+
+
+def jinja_env() -> Any:
+    "the jinja2 Environment used to render the templates"
+    from functools import partial
+    from urllib.parse import quote
+
+    from jinja2 import Environment
+
+    env = Environment(autoescape=True)
+    env.filters["urlquote"] = partial(quote, safe="")
+    return env
+
+
 def get_module_var(
     path: Path | str, var: str = "__version__", abort=True
 ) -> str | None:
@@ -139,6 +171,8 @@ def get_module_var(
         this uses ast to parse path, so it doesn't load the module
     """
 
+    import ast
+
     class V(ast.NodeVisitor):
         def __init__(self, keys):
             self.keys = keys
@@ -277,11 +311,31 @@ def validate_gdata(
     return missing, extra
 
 
+def local_build_number(repo: scm.GitRepo, master: str | None = None) -> int:
+    """a build number for local (non github) builds, increasing with the history
+
+    On a beta/N.M.O branch it counts the commits since the branch point
+    from master, otherwise the commits since the last release/N.M.O tag
+    (or all the commits if there's none).
+    """
+    base = None
+    if re.search(r"/beta/\d+([.]\d+)*$", repo.head.name):
+        master = master or repo.config.get("init.defaultbranch", "master")
+        base = repo.merge_base(master, "HEAD")
+    if not base:
+        base = repo.last_tag(["release/*", "*/release/*"])
+    return repo.count_commits("HEAD", base)
+
+
 def get_data(
     version_file: str | Path,
     github_dump: str | None = None,
     record_path: Path | None = None,
     abort: bool = True,
+    repo: scm.GitRepo | None = None,
+    local_build: bool = False,
+    tree_hash: bool = False,
+    ceiling: str | Path | None = None,
 ) -> tuple[dict[str, str | None], dict[str, Any]]:
     """extracts version information from github_dump and updates version_file in-place
 
@@ -289,6 +343,16 @@ def get_data(
         version_file (str, Path): path to a file  with a __version__ variable
         github_dump (str): the os.getenv("GITHUB_DUMP") value
         record: pull data from a _build.py file
+        repo: the git repo for version_file (default to the hooks context
+              file if fresh, or scm.lookup)
+        local_build: outside github set the build number from the git
+                     history (see local_build_number) instead of 0
+        tree_hash: add the "tree" key, the git tree sha of the version_file
+                   directory (with the local changes, see scm.GitRepo.tree_hash)
+        ceiling: the topmost directory searched for the repo (see scm.lookup)
+
+    The data comes from (in order) github_dump, the record, the hooks context
+    file or the repo: the repo is looked up only when needed.
 
     Returns:
         dict[str,str|None]: a dict with the current config
@@ -325,11 +389,24 @@ def get_data(
         "workflow": None,
     }
 
+    import json
+
+    from . import scm
+
     path = Path(version_file)
-    repo = scm.lookup(path)
     record = record_path.exists() if record_path else None
 
-    if not (repo or github_dump or record):
+    # the context written by the git hooks (see hooks.install)
+    context = None
+    if not (repo or github_dump or record or local_build or tree_hash):
+        from . import hooks
+
+        context = hooks.read_context(path)
+    # (a github dump or a record fully determine the data, unless tree_hash)
+    if not (repo or context) and (tree_hash or not (github_dump or record)):
+        repo = scm.lookup(path.absolute().parent, ceiling=ceiling)
+
+    if not (repo or github_dump or record or context):
         if abort:
             raise scm.InvalidGitRepoError(
                 f"cannot figure out settings (no repo in {path}, "
@@ -348,11 +425,19 @@ def get_data(
             "run_number": mod.build,
             "run_id": mod.runid,
         }
+    elif context:
+        gdata = {
+            "ref": context["ref"],
+            "sha": context["sha"],
+            "run_number": 0,
+            "run_id": 0,
+        }
+        dirty = hooks.context_dirty(context)
     elif repo:
         gdata = {
             "ref": repo.head.name,
             "sha": repo.head.target.hex,  # .hex[:7],
-            "run_number": 0,
+            "run_number": local_build_number(repo) if local_build else 0,
             "run_id": 0,
         }
         dirty = repo.dirty()
@@ -390,28 +475,218 @@ def get_data(
             data["workflow"] = "beta"
         else:
             data["workflow"] = "tags"
+
+    if tree_hash:
+        data["tree"] = repo.tree_hash(path.absolute().parent) if repo else None
     return data, gdata
 
 
 def update_version(
-    version_file: str | Path, github_dump: str | None = None, abort: bool = True
+    version_file: str | Path,
+    github_dump: str | None = None,
+    abort: bool = True,
+    stable: bool = False,
 ) -> str | None:
     """extracts version information from github_dump and updates version_file in-place
 
     Args:
         version_file (str, Path): path to a file with a __version__ variable
         github_dump (str): the os.getenv("GITHUB_DUMP") value
+        stable: leave version_file untouched (see process)
 
     Returns:
         str: the new version for the package
     """
 
     data = get_data(version_file, github_dump, abort=abort)[0]
-    set_module_var(version_file, "__version__", data["version"])
-    set_module_var(version_file, "__hash__", (data["sha"] or "")[:7])
+    if not stable:
+        set_module_var(version_file, "__version__", data["version"])
+        set_module_var(version_file, "__hash__", (data["sha"] or "")[:7])
     return data["version"]
 
 
+# the stable mode version file accessor, serving the record values lazily
+GETATTR_TEMPLATE = """
+
+# the build data (version, sha, build, runid ...) from the record (setuptools-github)
+def __getattr__(name):
+    from importlib import import_module
+
+    if not name.startswith("_"):
+        try:
+            return getattr(import_module("{module}", __package__), name)
+        except (ImportError, AttributeError):
+            pass
+    raise AttributeError(f"module {{__name__!r}} has no attribute {{name!r}}")
+"""
+
+
+def add_getattr(version_file: str | Path, record_path: Path) -> bool:
+    """appends to version_file a module __getattr__ reading the record
+
+    The file is left alone if it already has a __getattr__ (eg. added by a
+    previous call), so it's written once.
+
+    Returns:
+        bool: True if version_file was written
+    """
+    path = Path(version_file)
+    txt = path.read_text()
+    if re.search(r"^def __getattr__\(", txt, re.MULTILINE):
+        return False
+    try:
+        parts = record_path.relative_to(path.absolute().parent).with_suffix("").parts
+    except ValueError as exc:
+        raise ToolsError(
+            f"cannot import the record {record_path} from {version_file}", path
+        ) from exc
+    module = "." + ".".join(parts)
+    path.write_text(txt.rstrip("\n") + "\n" + GETATTR_TEMPLATE.format(module=module))
+    return True
+
+
+def write_record(record_path: Path, data: dict[str, Any]) -> bool:
+    """writes the data in the record (a _build.py file)
+
+    Returns:
+        bool: True if written (it's rewritten only when changed, keeping its .pyc)
+    """
+    lines = ["# autogenerate build file"]
+    for key, value in sorted((data or {}).items()):
+        lines.append(f"{key} = {value!r}")
+    txt = "\n".join(lines) + "\n"
+    if record_path.exists() and record_path.read_text() == txt:
+        return False
+    record_path.parent.mkdir(parents=True, exist_ok=True)
+    record_path.write_text(txt)
+    return True
+
+
+# the outdir file with the (source + data) hashes of the rendered paths
+MANIFEST_NAME = ".setuptools-github-manifest.json"
+
+
+def read_manifest(outdir: str | Path) -> dict[str, str]:
+    import json
+
+    try:
+        return json.loads((Path(outdir) / MANIFEST_NAME).read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+def write_manifest(outdir: str | Path, manifest: dict[str, str]) -> None:
+    import json
+    import os
+
+    path = Path(outdir) / MANIFEST_NAME
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(f".{os.getpid()}.tmp")
+    tmp.write_text(json.dumps(manifest, sort_keys=True))
+    tmp.replace(path)
+
+
+# the lazy BuildContext attributes: name -> function(ctx) computing the value
+CONTEXT_PROVIDERS: dict[str, Callable[[BuildContext], Any]] = {}
+
+
+def context_provider(name: str | None = None):
+    """registers a lazy attribute for the templates ctx
+
+    @tools.context_provider()
+    def last_tag(ctx):
+        ...
+    """
+
+    def register(fn: Callable[[BuildContext], Any]):
+        CONTEXT_PROVIDERS[name or fn.__name__] = fn
+        return fn
+
+    return register
+
+
+class BuildContext:
+    """the ctx object for the templates rendered by process
+
+    It has the data keys as attributes (these are the only ones listed by
+    items) plus the CONTEXT_PROVIDERS ones, computed on first access and
+    memoized for the context life.
+    """
+
+    def __init__(
+        self,
+        data: dict[str, Any],
+        version_file: str | Path | None = None,
+        repo: scm.GitRepo | None = None,
+    ):
+        self.__dict__.update(data)
+        self._data = data
+        self._version_file = version_file
+        self._repo = repo
+
+    def __getattr__(self, name: str) -> Any:
+        if name.startswith("_") or name not in CONTEXT_PROVIDERS:
+            raise AttributeError(name)
+        value = CONTEXT_PROVIDERS[name](self)
+        setattr(self, name, value)
+        return value
+
+    def items(self):
+        yield from self._data.items()
+
+    def git(self) -> scm.GitRepo | None:
+        "the version_file repo (if any)"
+        from . import scm
+
+        if self._repo is None and self._version_file:
+            self._repo = scm.lookup(Path(self._version_file).absolute().parent)
+        return self._repo
+
+    def log(self, fmt: str) -> list[str]:
+        "git log --format=fmt lines since the last release tag"
+        if not (repo := self.git()):
+            return []
+        since = [f"{self.last_tag}..HEAD"] if self.last_tag else ["HEAD"]
+        txt = repo(["log", f"--format={fmt}", *since])
+        return [line for line in txt.split("\n") if line]
+
+
+@context_provider()
+def last_tag(ctx: BuildContext) -> str | None:
+    "the last release/N.M.O (or name/release/N.M.O) tag"
+    repo = ctx.git()
+    return repo.last_tag(["release/*", "*/release/*"]) if repo else None
+
+
+@context_provider()
+def commit_count(ctx: BuildContext) -> int | None:
+    "the number of commits since the last release tag"
+    repo = ctx.git()
+    return repo.count_commits("HEAD", ctx.last_tag) if repo else None
+
+
+@context_provider()
+def changelog(ctx: BuildContext) -> list[Any]:
+    "the commits (changelog.Commit, rendering as the subject) since the last release"
+    from .changelog import entries
+
+    repo = ctx.git()
+    return entries(repo, "HEAD", ctx.last_tag) if repo else []
+
+
+@context_provider()
+def contributors(ctx: BuildContext) -> list[str]:
+    "the authors since the last release tag"
+    return sorted(set(ctx.log("%aN")))
+
+
+@context_provider()
+def dirty(ctx: BuildContext) -> list[str]:
+    "the modified (tracked) files"
+    repo = ctx.git()
+    return sorted(repo.status(untracked_files="no")) if repo else []
+
+
 def process(
     version_file: str | Path,
     github_dump: str | None = None,
@@ -419,15 +694,39 @@ def process(
     paths: str | Path | list[str | Path] | None = None,
     fixers: dict[str, str] | None = None,
     abort: bool = True,
+    repo: scm.GitRepo | None = None,
+    local_build: bool = False,
+    tree_hash: bool = False,
+    stable: bool = False,
+    outdir: str | Path | None = None,
+    ceiling: str | Path | None = None,
+    use_daemon: bool = False,
 ) -> dict[str, str | None]:
     """get version from github_dump and updates version_file/paths
 
     Args:
         version_file (str, Path): path to a file with __version__ variable
         github_dump (str): the os.getenv("GITHUB_DUMP") value
-        paths (str, Path): path(s) to files jinja2 processeable
+        paths (str, Path): path(s) to files jinja2 processeable (the files
+            without template syntax, after the fixers, are written as they are)
         fixers (dict[str,str]): fixer dictionary
         record: set to True will generate a _build.py sibling of version_file
+        repo: the git repo for version_file (default to scm.lookup)
+        local_build: derive the local build number from the git history
+        tree_hash: add the package tree hash ("tree" key, see get_data)
+        stable: leave version_file at the base __version__ (no __hash__),
+            the build data is only in the record: a module __getattr__
+            serving it lazily is added once (see add_getattr), so
+            package.version is the full version (eg. 1.2.3b98) and
+            package.sha the commit (__hash__ can't be lazy, modules have
+            it); the data comes from github_dump or the repo (the record is
+            read only without them)
+        outdir: write the rendered paths in outdir (see output_paths) leaving
+            the sources untouched, skipping the ones with unchanged sources
+            and data (tracked in the outdir MANIFEST_NAME file)
+        ceiling: the topmost directory searched for the repo (see scm.lookup)
+        use_daemon: ask the daemon (on its default socket) even when
+            $SETUPTOOLS_GITHUB_SOCKET isn't set (see the daemon module)
 
     Returns:
         str: the new version for the package
@@ -441,37 +740,82 @@ def process(
          'runid': 0
         }
     """
-    from argparse import Namespace
-    from functools import partial
-    from urllib.parse import quote
-
-    from jinja2 import Environment
-
-    class Context(Namespace):
-        def items(self):
-            for name, value in self.__dict__.items():
-                if name.startswith("_"):
-                    continue
-                yield (name, value)
+    from . import daemon
 
     record_path = (Path(version_file).parent / record).absolute() if record else None
-    data, _ = get_data(version_file, github_dump, record_path, abort)
-    set_module_var(version_file, "__version__", data["version"])
-    set_module_var(version_file, "__hash__", (data["sha"] or "")[:7])
-
-    env = Environment(autoescape=True)
-    env.filters["urlquote"] = partial(quote, safe="")
-    for path in list_of_paths(paths):
+    if stable and not record_path:
+        raise ToolsError("stable mode needs a record file", version_file)
+
+    # (stable: the record is an output, read only without a dump or a repo,
+    # eg. in an unpacked sdist)
+    source = record_path
+    if stable and not github_dump:
+        from . import scm
+
+        path = Path(version_file).absolute().parent
+        repo = repo or scm.lookup(path, ceiling=ceiling)
+        source = None if repo else record_path
+
+    # a running daemon (setuptools-github serve) answers faster
+    result = None
+    if not (repo or ceiling):
+        result = daemon.query(
+            version_file,
+            github_dump,
+            source,
+            abort,
+            path=daemon.socket_path() if use_daemon else None,
+            local_build=local_build,
+            tree_hash=tree_hash,
+        )
+    data, _ = result or get_data(
+        version_file,
+        github_dump,
+        source,
+        abort,
+        repo,
+        local_build,
+        tree_hash,
+        ceiling,
+    )
+    if not stable:
+        set_module_var(version_file, "__version__", data["version"])
+        set_module_var(version_file, "__hash__", (data["sha"] or "")[:7])
+    elif record_path:
+        # (version_file stays byte identical across commits and branches)
+        add_getattr(version_file, record_path)
+
+    targets = {p: p for p in list_of_paths(paths)}
+    manifest: dict[str, str] = {}
+    if outdir:
+        targets = output_paths(paths, outdir)
+        manifest = read_manifest(outdir)
+
+    # jinja2 is imported only if a file needs it
+    env = None
+    # one context for all the files, so the lazy attributes are computed once
+    ctx = BuildContext(data, version_file, repo)
+    for path, target in targets.items():
         txt = apply_fixers(path.read_text(), fixers)
-        tmpl = env.from_string(txt)
-        path.write_text(tmpl.render(ctx=Context(**data)))
+        if outdir:
+            import hashlib
+            import json
+
+            key = json.dumps([txt, data], sort_keys=True, default=str)
+            key = hashlib.sha256(key.encode("utf-8")).hexdigest()
+            name = target.relative_to(outdir).as_posix()
+            if manifest.get(name) == key and target.exists():
+                continue
+            manifest[name] = key
+        if is_template(txt):
+            env = env or jinja_env()
+            txt = env.from_string(txt).render(ctx=ctx)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_text(txt)
+    if outdir:
+        write_manifest(outdir, manifest)
 
     if record_path:
-        record_path.parent.mkdir(parents=True, exist_ok=True)
-        with record_path.open("w") as fp:
-            print("# autogenerate build file", file=fp)
-            for key, value in sorted((data or {}).items()):
-                value = f"'{value}'" if isinstance(value, str) else value
-                print(f"{key} = {value}", file=fp)
+        write_record(record_path, data)
 
     return data
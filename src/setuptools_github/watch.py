@@ -0,0 +1,206 @@
+"""keeps the build record and the rendered templates up to date
+
+    setuptools-github watch src/package_name/__init__.py --template README.md \\
+        --outdir build/watch
+
+It waits (using inotify, or polling where not available) for changes in
+the git directories (HEAD, refs, index) and in the templates, then updates
+the record (_build.py) and re-renders only the affected templates.
+
+The tracked files are never written (a dirty worktree would stop a git
+checkout): the version file is left alone as in the tools.process stable
+mode (its module __getattr__ serves the record) and the templates are
+rendered in outdir (see tools.output_paths).
+"""
+from __future__ import annotations
+
+import logging
+import os
+from pathlib import Path
+from typing import Any, Callable
+
+from . import daemon, tools
+
+log = logging.getLogger(__name__)
+
+
+def signature(path: Path) -> tuple[int, int] | None:
+    try:
+        stat = path.stat()
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+class WatchedRepo(daemon.WarmRepo):
+    def __call__(self, cmd, input=None, env=None):  # noqa: A002
+        # no opportunistic index refresh (the writes would wake us up again)
+        return super().__call__(cmd, input, {"GIT_OPTIONAL_LOCKS": "0", **(env or {})})
+
+
+class Watcher:
+    "the record and templates state (with a warm repo and jinja env)"
+
+    def __init__(
+        self,
+        version_file: str | Path,
+        paths: list[str | Path] | None = None,
+        github_dump: str | None = None,
+        fixers: dict[str, str] | None = None,
+        outdir: str | Path | None = None,
+        record: str | Path = "_build.py",
+    ):
+        from . import scm
+
+        self.version_file = Path(version_file).absolute()
+        repo = scm.lookup(self.version_file.parent)
+        if not repo:
+            raise scm.InvalidGitRepoError(f"no git repo for {self.version_file}")
+        if paths and not outdir:
+            raise tools.ToolsError("the templates need an outdir", self.version_file)
+        self.repo = WatchedRepo(repo.workdir)
+        self.github_dump = github_dump
+        self.fixers = fixers
+        self.record_path = self.version_file.parent / record
+
+        self.env: Any = None
+
+        # source -> rendered path, source -> its signature when last rendered
+        self.targets = tools.output_paths(paths, outdir) if outdir else {}
+        self.sources: dict[Path, tuple[int, int] | None] = {}
+        self.data: dict[str, Any] | None = None
+        self.key: tuple[Any, ...] = ()
+
+    def watched(self) -> list[Path]:
+        "the directories to watch"
+        # (in a linked worktree HEAD and index are in its gitdir, refs in commondir)
+        gitdir, commondir = self.repo.disk.gitdir, self.repo.disk.commondir
+        result = {gitdir, commondir, *(p.parent for p in self.targets)}
+        for root in [commondir / "refs" / "heads", commondir / "refs" / "tags"]:
+            result.update(p for p in root.rglob("*") if p.is_dir())
+            result.add(root)
+        return sorted(p for p in result if p.is_dir())
+
+    def refresh(self) -> list[Path]:
+        """re-renders what changed since the last call
+
+        Returns:
+            list[Path]: the files written
+        """
+        # templates edited since rendered
+        changed = {p for p in self.targets if signature(p) != self.sources.get(p)}
+
+        key = self.repo.signature()
+        if self.data is None or key != self.key:
+            data = tools.get_data(self.version_file, self.github_dump, repo=self.repo)
+            self.key = key
+            if data[0] != self.data:
+                self.data = data[0]
+                changed.update(self.targets)
+        if self.data is None:
+            return []
+
+        written = []
+        if tools.write_record(self.record_path, self.data):
+            written.append(self.record_path)
+
+        ctx = None
+        for path in sorted(changed):
+            self.sources[path] = signature(path)
+            if not path.exists():
+                continue
+            rendered = tools.apply_fixers(path.read_text(), self.fixers)
+            if tools.is_template(rendered):
+                ctx = ctx or tools.BuildContext(self.data, self.version_file, self.repo)
+                self.env = self.env or tools.jinja_env()
+                rendered = self.env.from_string(rendered).render(ctx=ctx)
+            target = self.targets[path]
+            if not target.exists() or target.read_text() != rendered:
+                target.parent.mkdir(parents=True, exist_ok=True)
+                target.write_text(rendered)
+                written.append(target)
+        return written
+
+
+class Inotify:
+    "a minimal (linux) inotify wrapper, raising OSError where not available"
+
+    # IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE
+    MASK = 0x002 | 0x004 | 0x008 | 0x080 | 0x100 | 0x200
+
+    def __init__(self) -> None:
+        import ctypes
+        import ctypes.util
+
+        try:
+            self.libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            self.fd = self.libc.inotify_init1(os.O_CLOEXEC)
+        except (OSError, AttributeError) as exc:
+            raise OSError("inotify not available") from exc
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.watches: set[Path] = set()
+
+    def add(self, path: Path) -> None:
+        if path in self.watches:
+            return
+        if self.libc.inotify_add_watch(self.fd, os.fsencode(path), self.MASK) >= 0:
+            self.watches.add(path)
+
+    def wait(self, timeout: float | None = None) -> bool:
+        "waits for events (returns False on timeout)"
+        from select import select
+        from time import sleep
+
+        if not select([self.fd], [], [], timeout)[0]:
+            return False
+        # coalesces the bursts (eg. a checkout)
+        sleep(0.01)
+        while select([self.fd], [], [], 0)[0]:
+            os.read(self.fd, 2**16)
+        return True
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+def watch(
+    watcher: Watcher,
+    poll: float = 0,
+    stop: Callable[[], bool] | None = None,
+    callback: Callable[[list[Path]], Any] | None = None,
+) -> None:
+    """refreshes watcher on changes (until stop returns True)
+
+    Args:
+        watcher: the Watcher
+        poll: polling interval in seconds (0 to use inotify when available)
+        stop: called after each wait, the loop ends when it returns True
+        callback: called with the files written on each refresh
+    """
+    from time import sleep
+
+    inotify = None
+    if not poll:
+        try:
+            inotify = Inotify()
+        except OSError:
+            log.info("inotify not available, polling")
+    try:
+        while True:
+            if written := watcher.refresh():
+                log.info("updated %s", ", ".join(str(p) for p in written))
+                if callback:
+                    callback(written)
+            if stop and stop():
+                break
+            if inotify:
+                # (new branches create new ref directories)
+                for path in watcher.watched():
+                    inotify.add(path)
+                inotify.wait(1.0)
+            else:
+                sleep(poll or 1.0)
+    finally:
+        if inotify:
+            inotify.close()
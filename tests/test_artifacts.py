@@ -0,0 +1,37 @@
+from setuptools_github import artifacts
+
+
+def test_build_wheel(git_project_factory, tmp_path, monkeypatch):
+    monkeypatch.setenv(artifacts.CACHE_ENV, str(tmp_path / "cache"))
+    repo = git_project_factory().create("0.0.0")
+    builds = []
+
+    def builder(project, outdir):
+        builds.append(project)
+        wheel = outdir / "pkg-0.0.0-py3-none-any.whl"
+        wheel.write_text(f"build {len(builds)}\n")
+        return wheel
+
+    def build():
+        return artifacts.build_wheel(
+            repo.initfile, outdir=tmp_path / "dist", builder=builder
+        )
+
+    wheel, reused = build()
+    assert (wheel, reused) == (tmp_path / "dist" / wheel.name, False)
+    assert builds == [repo.workdir]
+
+    # a commit outside the package sources reuses the wheel
+    (repo.workdir / "README.txt").write_text("hello\n")
+    repo.commit(repo.workdir / "README.txt", "docs")
+    wheel, reused = build()
+    assert reused
+    assert wheel.read_text() == "build 1\n"
+    assert len(builds) == 1
+
+    # a change in the package sources triggers a new build
+    (repo.workdir / "src" / "mod.py").write_text("x = 1\n")
+    wheel, reused = build()
+    assert not reused
+    assert wheel.read_text() == "build 2\n"
+    assert len(list((tmp_path / "cache").glob("*/*.whl"))) == 2
@@ -0,0 +1,26 @@
+from setuptools_github import batch
+
+
+def test_get_data_many(git_project_factory, tmp_path):
+    repo = git_project_factory().create("1.2.3")
+    repo1 = git_project_factory().create("0.0.1")
+    repo1.branch("beta/0.0.1", "master")
+    missing = tmp_path / "norepo" / "__init__.py"
+    missing.parent.mkdir()
+    missing.write_text('__version__ = "9.9.9"\n')
+
+    results = {
+        result["version_file"]: result
+        for result in batch.get_data_many(
+            [repo.initfile, repo1.initfile, missing], workers=2
+        )
+    }
+    assert results[str(repo.initfile)]["data"]["version"] == "1.2.3"
+    assert results[str(repo1.initfile)]["data"]["version"] == "0.0.1b0"
+    assert results[str(repo1.initfile)]["data"]["branch"] == "beta/0.0.1"
+    assert results[str(missing)]["error"].startswith("InvalidGitRepoError:")
+
+    # process updates the version files
+    results = list(batch.get_data_many([repo1.initfile], process=True))
+    assert results[0]["data"]["version"] == "0.0.1b0"
+    assert repo1.initfile.read_text().startswith('__version__ = "0.0.1b0"')
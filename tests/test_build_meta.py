@@ -0,0 +1,99 @@
+import json
+import os
+
+from setuptools_github import build_meta, tools
+
+
+def test_process(git_project_factory, monkeypatch):
+    repo = git_project_factory().create("1.2.3")
+    monkeypatch.chdir(repo.workdir)
+
+    calls = []
+    process = tools.process
+
+    def counted(*args, **kwargs):
+        calls.append(args[0])
+        return process(*args, **kwargs)
+
+    monkeypatch.setattr(tools, "process", counted)
+
+    # outside a build: always tools.process
+    build_meta.process(repo.initfile, record=None)
+    build_meta.process(repo.initfile, record=None)
+    assert len(calls) == 2
+
+    # the get_requires hooks defer, the next hooks share a single process
+    seen = []
+    monkeypatch.setattr(
+        build_meta._backend(),
+        "get_requires_for_build_wheel",
+        lambda config_settings: seen.append(build_meta.process(repo.initfile)),
+    )
+    monkeypatch.setattr(
+        build_meta._backend(),
+        "build_wheel",
+        lambda *args: build_meta.process(repo.initfile, record=None),
+    )
+    build_meta.get_requires_for_build_wheel()
+    assert seen[0]["version"] == "1.2.3"
+    assert seen[0]["sha"] is None
+    assert len(calls) == 2
+
+    handoff = build_meta.handoff_path(repo.workdir)
+    assert build_meta.read_handoff(handoff) == {}
+    data = build_meta.process(repo.initfile, record=None)
+    assert build_meta.process(repo.initfile, record=None) == data
+    assert len(calls) == 3
+
+    # the paths in the key are normalized
+    monkeypatch.chdir(repo.workdir / "src")
+    assert build_meta.process("../src/__init__.py", record=None) == data
+    assert len(calls) == 3
+    monkeypatch.chdir(repo.workdir)
+
+    # a new HEAD is a new key
+    repo(["checkout", "-q", "-b", "beta/1.2.3"])
+    assert build_meta.process(repo.initfile, record=None)["version"] == "1.2.3b0"
+    assert len(calls) == 4
+
+    # the build ends
+    assert build_meta.build_wheel("dist") == {
+        **data,
+        "branch": "beta/1.2.3",
+        "ref": "refs/heads/beta/1.2.3",
+        "version": "1.2.3b0",
+        "workflow": "beta",
+    }
+    assert not handoff.exists()
+    assert len(calls) == 4
+
+
+def test_leaked_handoff(git_project_factory, monkeypatch):
+    "a handoff left by an interrupted build is used only by the same frontend"
+    import subprocess
+    import sys
+
+    repo = git_project_factory().create("1.2.3")
+    monkeypatch.chdir(repo.workdir)
+    monkeypatch.setattr(
+        build_meta._backend(), "get_requires_for_build_wheel", lambda *args: []
+    )
+    build_meta.get_requires_for_build_wheel()
+    data = build_meta.process(repo.initfile, record=None)
+    handoff = build_meta.handoff_path(repo.workdir)
+    assert handoff.exists()
+
+    # (no build_* hook) a plain setup.py run from another process
+    repo(["checkout", "--", repo.initfile])
+    monkeypatch.setattr(os, "getppid", lambda: -1)
+    assert build_meta.process(repo.initfile, record=None) == data
+    assert tools.get_module_var(repo.initfile, "__hash__") == data["sha"][:7]
+    assert handoff.exists()  # (its frontend is still running)
+
+    # the handoff of a gone frontend is removed
+    proc = subprocess.Popen([sys.executable, "-c", "pass"])
+    proc.wait()
+    content = json.loads(handoff.read_text())
+    handoff.write_text(json.dumps({**content, "owner": proc.pid}))
+    assert build_meta.read_handoff(handoff) is None
+    assert not handoff.exists()
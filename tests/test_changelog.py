@@ -0,0 +1,61 @@
+import json
+
+from setuptools_github import changelog
+
+
+def commit(repo, name):
+    path = repo.workdir / f"{name}.txt"
+    path.write_text(f"{name}\n")
+    repo.commit(path, f"add {name}")
+
+
+def test_sections(git_project_factory):
+    repo = git_project_factory().create("0.0.0")
+    repo(["tag", "-a", "-m", "release", "release/0.0.0"])
+    commit(repo, "a")
+    commit(repo, "b")
+    repo(["tag", "-a", "-m", "release", "release/0.0.1"])
+    commit(repo, "c")
+    repo(["tag", "-a", "-m", "release", "release/0.0.10"])
+    repo.branch("beta/0.0.11", "master")
+    commit(repo, "d")
+
+    assert changelog.releases(repo) == [
+        "release/0.0.0",
+        "release/0.0.1",
+        "release/0.0.10",
+    ]
+
+    result = changelog.sections(repo)
+    assert [(title, [str(c) for c in commits]) for title, commits in result] == [
+        ("beta/0.0.11 (unreleased)", ["add d"]),
+        ("release/0.0.10", ["add c"]),
+        ("release/0.0.1", ["add b", "add a"]),
+        ("release/0.0.0", ["initial commit", "initial"]),
+    ]
+    assert result[0][1][0].author == "First Last"
+    assert result[0][1][0].sha == repo.rev_parse("HEAD")
+
+    # the tag pairs are cached (and not the unreleased commits)
+    path = repo.workdir / ".git" / changelog.CACHE_NAME
+    cached = json.loads(path.read_text())
+    assert len(cached) == 3
+    key = next(k for k, v in cached.items() if len(v) == 1)
+    cached[key][0][3] = "from the cache"
+    path.write_text(json.dumps(cached))
+    assert [str(c) for c in changelog.sections(repo)[1][1]] == ["from the cache"]
+
+    txt = changelog.render(result)
+    assert txt.startswith("## beta/0.0.11 (unreleased)\n\n- add d (")
+    assert "\n## release/0.0.1\n\n- add b" in txt
+
+
+def test_iter_log_multiline(git_project_factory):
+    repo = git_project_factory().create("0.0.0")
+    path = repo.workdir / "x.txt"
+    path.write_text("x\n")
+    repo(["add", path])
+    repo(["commit", "-m", "subject line\n\nbody\nwith lines"])
+
+    commits = list(changelog.iter_log(repo, "HEAD"))
+    assert [c.subject for c in commits] == ["subject line", "initial commit", "initial"]
@@ -67,3 +67,10 @@ options:
 
         stack.enter_context(mock.patch("argparse._HelpAction.__call__", new=xxx))
         hello(["--help"])
+
+
+def test_errorfn():
+    # (defined at runtime, not only for the type checkers)
+    from setuptools_github.cli import ErrorFn
+
+    assert callable(ErrorFn.__call__)
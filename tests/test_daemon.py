@@ -0,0 +1,152 @@
+import os
+import threading
+
+import pytest
+
+from setuptools_github import daemon, tools
+
+
+@pytest.fixture()
+def server(tmp_path, monkeypatch):
+    path = tmp_path / "s.sock"
+    monkeypatch.setenv(daemon.SOCKET_ENV, str(path))
+    server = daemon.make_server()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    assert not path.exists()
+
+
+def test_socket_path(tmp_path, monkeypatch):
+    monkeypatch.setenv(daemon.SOCKET_ENV, str(tmp_path / "abc.sock"))
+    assert daemon.socket_path() == tmp_path / "abc.sock"
+    assert daemon.query(tmp_path / "__init__.py") is None
+
+    # the default is in a private directory
+    monkeypatch.delenv(daemon.SOCKET_ENV)
+    monkeypatch.setenv("XDG_RUNTIME_DIR", str(tmp_path / "run"))
+    assert daemon.socket_path() == tmp_path / "run" / daemon.SOCKET_NAME
+    monkeypatch.delenv("XDG_RUNTIME_DIR")
+    assert daemon.socket_path().parent.name == f"setuptools-github-{os.getuid()}"
+
+    path = daemon.private_dir(tmp_path / "private")
+    assert path.stat().st_mode & 0o777 == 0o700
+    path.chmod(0o755)
+    with pytest.raises(tools.ToolsError):
+        daemon.private_dir(path)
+
+
+def test_opt_in(git_project_factory, tmp_path, monkeypatch):
+    "the daemon is asked only when $SETUPTOOLS_GITHUB_SOCKET is set (or use_daemon)"
+    repo = git_project_factory().create("1.2.3")
+    monkeypatch.delenv(daemon.SOCKET_ENV, raising=False)
+    monkeypatch.setenv("XDG_RUNTIME_DIR", str(daemon.private_dir(tmp_path / "run")))
+    server = daemon.make_server()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        assert daemon.socket_path().exists()
+        assert daemon.query(repo.initfile) is None
+        data, _ = daemon.query(repo.initfile, path=daemon.socket_path())
+        assert data["version"] == "1.2.3"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    # only a socket of the user is trusted
+    path = tmp_path / "not-a-socket"
+    path.write_text("")
+    assert daemon.query(repo.initfile, path=path) is None
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        {"version": '1.2.3"\nimport os', "sha": None},
+        {"version": "1.2.3", "sha": "abc'\nimport os"},
+        {"version": "1.2.3", "sha": None, "branch": "x\nimport os"},
+        {"version": None},
+        [],
+    ],
+)
+def test_invalid_reply(git_project_factory, tmp_path, monkeypatch, data):
+    "a reply with values in the wrong format is discarded"
+    import json
+    import socketserver
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            self.rfile.readline()
+            reply = {"data": data, "gdata": {}}
+            self.wfile.write(json.dumps(reply).encode("utf-8") + b"\n")
+
+    path = tmp_path / "s.sock"
+    monkeypatch.setenv(daemon.SOCKET_ENV, str(path))
+    server = socketserver.ThreadingUnixStreamServer(str(path), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    repo = git_project_factory().create("1.2.3")
+    try:
+        assert daemon.query(repo.initfile) is None
+        assert tools.process(repo.initfile)["version"] == "1.2.3"
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert tools.get_module_var(repo.initfile, "__version__") == "1.2.3"
+
+
+def test_query(git_project_factory, server):
+    repo = git_project_factory().create("1.2.3")
+
+    assert daemon.query(repo.initfile) == tools.get_data(repo.initfile)
+
+    # the warm repo follows the branch changes
+    repo.branch("beta/1.2.3", "master")
+    data, _ = daemon.query(repo.initfile)
+    assert data["version"] == "1.2.3b0"
+    assert data["sha"] == repo.head.target.hex
+
+    (repo.workdir / "new.txt").write_text("hello")
+    repo.commit(repo.workdir / "new.txt", "a new commit")
+    data, _ = daemon.query(repo.initfile)
+    assert data["sha"] == repo.head.target.hex
+
+    # errors fall back to the in-process get_data
+    repo.branch("beta/0.0.0", "master")
+    assert daemon.query(repo.initfile) is None
+
+
+def test_query_worktree(git_project_factory, server):
+    "in a linked worktree (.git is a file) the warm repo follows the commits"
+    from setuptools_github import scm
+
+    repo = git_project_factory().create("1.2.3")
+    linked = repo.workdir.parent / "linked"
+    repo(["worktree", "add", "-q", "-b", "other", linked])
+    worktree = scm.GitRepo(linked)
+    initfile = linked / repo.initfile.relative_to(repo.workdir)
+
+    data, _ = daemon.query(initfile)
+    assert data["sha"] == worktree.rev_parse("HEAD")
+    (linked / "new.txt").write_text("hello")
+    worktree.commit(linked / "new.txt", "a new commit")
+    data, _ = daemon.query(initfile)
+    assert data["sha"] == worktree.rev_parse("HEAD")
+
+
+def test_process(git_project_factory, server, monkeypatch):
+    replies = []
+
+    def query(*args, **kwargs):
+        replies.append(original(*args, **kwargs))
+        return replies[-1]
+
+    original = daemon.query
+    monkeypatch.setattr(daemon, "query", query)
+
+    repo = git_project_factory().create("1.2.3")
+    repo.branch("beta/1.2.3", "master")
+    assert tools.process(repo.initfile)["version"] == "1.2.3b0"
+    assert replies[0][0]["version"] == "1.2.3b0"
@@ -0,0 +1,114 @@
+import pytest
+
+from setuptools_github import hooks, scm, tools
+
+
+def test_install(git_project_factory, monkeypatch):
+    repo = git_project_factory().create("0.0.0")
+    installed = hooks.install(repo, [repo.initfile])
+    assert [p.name for p in installed] == hooks.HOOKS
+    assert all(p.stat().st_mode & 0o100 for p in installed)
+
+    # the context file is ignored
+    context = hooks.context_path(repo.initfile)
+    assert context.exists()
+    assert not repo.status()
+    assert hooks.read_context(repo.initfile)["ref"] == "refs/heads/master"
+
+    # reinstalling is fine, not our hooks are left alone
+    hooks.install(repo, [repo.initfile])
+    (repo.workdir / ".git" / "hooks" / "post-merge").write_text("#!/bin/sh\n")
+    with pytest.raises(tools.ToolsError):
+        hooks.install(repo, [repo.initfile])
+    hooks.install(repo, [repo.initfile], force=True)
+
+    # the hooks update the context (no git queries in get_data)
+    repo(["checkout", "-q", "-b", "beta/0.0.0"])
+    assert hooks.read_context(repo.initfile)["version"] == "0.0.0b0"
+
+    def nohead(*args):
+        raise AssertionError("head queried")
+
+    def nodiff(*args):
+        raise AssertionError("git diff run")
+
+    with monkeypatch.context() as mp:
+        mp.setattr(scm.GitRepo, "head", property(nohead))
+        mp.setattr(scm, "lookup", nohead)
+        mp.setattr(hooks, "dirty", nodiff)
+        data = tools.get_data(repo.initfile)[0]
+    assert data["branch"] == "beta/0.0.0"
+    assert data["version"] == "0.0.0b0"
+    assert data["sha"] == repo.rev_parse("HEAD")
+
+    # the local changes are still marked (and the context stays fresh)
+    repo.initfile.write_text('__version__ = "0.0.0"\n# a change\n')
+    assert tools.get_data(repo.initfile)[0]["sha"] == repo.rev_parse("HEAD") + "*"
+    assert hooks.read_context(repo.initfile)
+
+    # a changed file, with the same content
+    repo(["checkout", "--", repo.initfile])
+    repo.initfile.touch()
+    assert tools.get_data(repo.initfile)[0]["sha"] == repo.rev_parse("HEAD")
+
+
+def test_main(git_project_factory):
+    "the hooks entry point writes the context without a git status"
+    repo = git_project_factory().create("0.0.0")
+    repo.branch("beta/0.0.0", "master")
+    index = repo.workdir / ".git" / "index"
+    before = index.stat().st_mtime_ns
+
+    hooks.main([str(repo.initfile)])
+    context = hooks.read_context(repo.initfile)
+    assert context["version"] == "0.0.0b0"
+    assert context["sha"] == repo.rev_parse("HEAD")
+    assert index.stat().st_mtime_ns == before
+
+
+def test_read_context_stale(git_project_factory):
+    repo = git_project_factory().create("0.0.0")
+    hooks.write_context(repo, repo.initfile)
+    assert hooks.read_context(repo.initfile)
+
+    # no hooks installed: a commit changes the index/HEAD
+    path = repo.workdir / "a.txt"
+    path.write_text("a\n")
+    repo.commit(path, "add a")
+    assert hooks.read_context(repo.initfile) is None
+    assert tools.get_data(repo.initfile)[0]["sha"] == repo.rev_parse("HEAD")
+
+
+def test_read_context_moved_branch(git_project_factory):
+    "moving the branch without touching HEAD or the index makes the context stale"
+    repo = git_project_factory().create("0.0.0")
+    path = repo.workdir / "a.txt"
+    path.write_text("a\n")
+    repo.commit(path, "add a")
+    hooks.write_context(repo, repo.initfile)
+    assert hooks.read_context(repo.initfile)
+
+    repo(["update-ref", "refs/heads/master", "HEAD~1"])
+    assert hooks.read_context(repo.initfile) is None
+    # (a.txt is now a local change)
+    assert tools.get_data(repo.initfile)[0]["sha"] == repo.rev_parse("HEAD") + "*"
+
+
+def test_rebase_skip(git_project_factory):
+    repo = git_project_factory().create("0.0.0")
+    hooks.install(repo, [repo.initfile])
+    repo.branch("feature", "master")
+    for name in ["a", "b", "c"]:
+        path = repo.workdir / f"{name}.txt"
+        path.write_text(f"{name}\n")
+        repo.commit(path, f"add {name}")
+    repo(["checkout", "-q", "master"])
+    path = repo.workdir / "m.txt"
+    path.write_text("m\n")
+    repo.commit(path, "add m")
+
+    repo(["checkout", "-q", "feature"])
+    repo(["rebase", "-q", "master"])
+    context = hooks.read_context(repo.initfile)
+    assert context["ref"] == "refs/heads/feature"
+    assert context["sha"] == repo.rev_parse("HEAD")
@@ -0,0 +1,67 @@
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+SRC = Path(__file__).parent.parent / "src"
+
+# the heavy modules setup.py (and --help) shouldn't import
+HEAVY = {
+    "setuptools_github.scm",
+    "subprocess",
+    "json",
+    "ast",
+    "typing_extensions",
+    "jinja2",
+}
+
+
+def importtime(code):
+    "the imported modules and the {module: cumulative time in us} top level ones"
+    proc = subprocess.run(  # noqa: S603
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        env={"PYTHONPATH": str(SRC)},
+    )
+    result, toplevel = {}, {}
+    for line in proc.stderr.split("\n"):
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit():
+            result[name.strip()] = int(cumulative)
+            if not name.startswith("  "):
+                toplevel[name.strip()] = int(cumulative)
+    return proc.returncode, result, toplevel
+
+
+def test_engines():
+    from setuptools_github import release, script
+
+    assert script.ENGINES == sorted(release.ENGINES)
+
+
+@pytest.mark.parametrize(
+    "code, heavy, budget",
+    [
+        ("import setuptools_github.tools", HEAVY, 0.2),
+        (
+            "import sys; sys.argv = ['setuptools-github', '--help']; "
+            "from setuptools_github.script import main; main()",
+            HEAVY | {"logging", "setuptools_github.release", "setuptools_github.scm"},
+            0.3,
+        ),
+    ],
+)
+def test_import_budget(code, heavy, budget):
+    returncode, modules, toplevel = importtime(code)
+    assert returncode == 0
+    assert not heavy & set(modules)
+
+    # (generous, it's a regression guard not a benchmark)
+    total = sum(
+        t for name, t in toplevel.items() if name.startswith("setuptools_github")
+    )
+    assert total / 1e6 < budget
@@ -0,0 +1,60 @@
+import pytest
+
+from setuptools_github import release, scm, tools
+
+
+def make_beta(git_project_factory, diverge=False):
+    repo = git_project_factory().create("0.0.0")
+    repo.branch("beta/0.0.0", "master")
+    (repo.workdir / "beta.txt").write_text("beta\n")
+    repo.commit(repo.workdir / "beta.txt", "a beta fix")
+    if diverge:
+        repo(["checkout", "master"])
+        (repo.workdir / "master.txt").write_text("master\n")
+        repo.commit(repo.workdir / "master.txt", "a master change")
+        repo(["checkout", "beta/0.0.0"])
+    return repo
+
+
+def log(repo, ref):
+    return repo(["log", "--format=%s", ref]).strip().split("\n")
+
+
+@pytest.mark.parametrize("engine", sorted(release.ENGINES))
+@pytest.mark.parametrize("diverge", [False, True])
+def test_engines(git_project_factory, engine, diverge):
+    repo = make_beta(git_project_factory, diverge)
+    release.ENGINES[engine](repo, repo.initfile, "0.0.0", "0.0.1", "master")
+
+    assert log(repo, "release/0.0.0")[:2] == ["released 0.0.0", "a beta fix"]
+    assert repo(["cat-file", "-t", "release/0.0.0"]).strip() == "tag"
+    assert repo.rev_parse("release/0.0.0^{commit}") == repo.rev_parse("beta/0.0.0")
+
+    assert log(repo, "master")[0] == "version bump 0.0.0 -> 0.0.1"
+    assert repo.is_ancestor("beta/0.0.0", "master")
+    if diverge:
+        assert log(repo, "master")[1] == "Merge branch 'beta/0.0.0'"
+        assert "master.txt" in repo(["ls-tree", "--name-only", "master"])
+    else:
+        assert log(repo, "master")[1] == "released 0.0.0"
+    assert repo(["show", "master:src/__init__.py"]) == '__version__ = "0.0.1"\n'
+    assert not repo.status(untracked_files="no")
+
+    if engine in {"plumbing", "worktree"}:
+        # the worktree is left alone
+        assert repo.head.name == "refs/heads/beta/0.0.0"
+        assert tools.get_module_var(repo.initfile) == "0.0.0"
+        assert len(repo(["worktree", "list"]).strip().split("\n")) == 1
+    else:
+        assert repo.head.name == "refs/heads/master"
+        assert tools.get_module_var(repo.initfile) == "0.0.1"
+
+
+def test_plumbing_atomic(git_project_factory):
+    repo = make_beta(git_project_factory)
+    repo(["tag", "release/0.0.0", "master"])
+    before = repo(["for-each-ref"])
+
+    with pytest.raises(scm.GitError):
+        release.plumbing(repo, repo.initfile, "0.0.0", "0.0.1", "master")
+    assert repo(["for-each-ref"]) == before
@@ -1,3 +1,6 @@
+import io
+import importlib.util
+import os
 import subprocess
 
 import pytest
@@ -133,3 +136,419 @@ REPO: {project.workdir}
 
     repox = scm.GitRepo(project.workdir)
     assert project.dumps() == repox.dumps()
+
+
+def test_fetch(git_project_factory):
+    "fetch only the requested branches (no tags) from bare remotes"
+    repo = git_project_factory().create("0.0.0")
+    repo.branch("beta/0.0.0")
+    repo.branch("feature/abc", "master")
+    repo(["tag", "-m", "release", "release/0.0.0"])
+
+    upstream = repo.workdir.parent / "upstream.git"
+    repo(["clone", "--bare", repo.workdir, upstream])
+
+    project = git_project_factory().create()
+    project(["remote", "add", "upstream", upstream])
+    project(["remote", "add", "mirror", upstream])
+    assert project.remotes == ["mirror", "upstream"]
+
+    fetched = project.fetch(["master", "beta/*"], tags=False, jobs=2)
+    assert set(fetched) == {"upstream", "mirror"}
+    assert set(project.branches.remote) == {
+        "mirror/master",
+        "mirror/beta/0.0.0",
+        "upstream/master",
+        "upstream/beta/0.0.0",
+    }
+    assert project.references == []
+    assert "beta/0.0.0" in (project.gitdir / "FETCH_HEAD").read_text()
+
+    # a recent FETCH_HEAD is reused
+    assert project.fetch(max_age=3600) == []
+    assert project.references == []
+
+    assert project.fetch(remotes=["upstream"]) == ["upstream"]
+    assert "upstream/feature/abc" in project.branches.remote
+    assert project.references == ["refs/tags/release/0.0.0"]
+
+    # a linked worktree (.git is a file) has its own FETCH_HEAD
+    linked = project.workdir.parent / "linked"
+    project(["worktree", "add", "-q", linked, "-b", "linked"])
+    worktree = scm.GitRepo(linked)
+    assert worktree.fetch(["master"], tags=False) == ["mirror", "upstream"]
+    fetch_head = worktree.git_path("FETCH_HEAD")
+    assert fetch_head.parent == project.gitdir / "worktrees" / "linked"
+    assert len(fetch_head.read_text().splitlines()) == 2
+
+    # a remote without master (or beta/*) doesn't fail the fetch
+    other = repo.workdir.parent / "other.git"
+    cmd = ["git", "init", "-q", "--bare", str(other)]
+    subprocess.check_call(cmd)  # noqa: S603
+    repo(["push", "-q", other, "feature/abc"])
+    project(["remote", "add", "other", other])
+    fetched = project.fetch(["master", "beta/*"], remotes=["other", "upstream"])
+    assert fetched == ["other", "upstream"]
+    assert not any(b.startswith("other/") for b in project.branches.remote)
+
+
+def test_lookup_cache(git_project_factory):
+    repo = git_project_factory().create("0.0.0")
+    (repo.workdir / "a" / "b").mkdir(parents=True)
+    (repo.workdir / "a" / "c").mkdir(parents=True)
+
+    cache = {}
+    assert scm.lookup(repo.workdir / "a" / "b", cache).workdir == repo.workdir
+    assert set(cache) == {repo.workdir / "a" / "b", repo.workdir / "a", repo.workdir}
+
+    # a sibling directory stops at the cached parent
+    assert scm.lookup(repo.workdir / "a" / "c", cache).workdir == repo.workdir
+    assert repo.workdir / "a" / "c" in cache
+
+
+def test_records():
+    fp = io.BytesIO(b"a\0bb\0" + b"c" * 10 + b"\0\0d")
+    assert list(scm.records(fp, b"\0", size=3)) == [b"a", b"bb", b"c" * 10, b"", b"d"]
+
+
+def test_stream(git_project_factory):
+    repo = git_project_factory().create("0.0.0")
+    # a non utf-8 file name
+    (repo.workdir / os.fsdecode(b"caf\xe9.txt")).write_text("x")
+    (repo.workdir / "b c.txt").write_text("x")
+
+    assert repo.run_bytes(["rev-parse", "HEAD"]).strip() == repo.rev_parse(
+        "HEAD"
+    ).encode("ascii")
+    records = list(repo.stream(["ls-files", "-z", "--others"]))
+    assert set(records) == {b"caf\xe9.txt", b"b c.txt"}
+
+    # the (cli) status paths are not quoted
+    cli = scm.CliBackend(repo)
+    assert set(cli.status()) == {os.fsdecode(b"caf\xe9.txt"), "b c.txt"}
+    assert cli.branches().local == ["master"]
+
+    # stopping early (the process is killed) or a failing command
+    assert next(repo.stream(["rev-list", "HEAD"], b"\n"))
+    with pytest.raises(subprocess.CalledProcessError):
+        list(repo.stream(["rev-parse", "missing"]))
+
+
+def test_parse_timeouts():
+    assert scm.parse_timeouts("fetch=60, clone=1.5") == {"fetch": 60, "clone": 1.5}
+    assert scm.parse_timeouts(["30", "merge=5"]) == {
+        "fetch": 30,
+        "clone": 30,
+        "merge": 5,
+    }
+    assert scm.git_verb(["-c", "core.sparseCheckout=true", "merge", "x"]) == "merge"
+    assert scm.git_verb("status") == "status"
+
+
+def test_run(git_project_factory):
+    import asyncio
+    import threading
+    import time
+
+    repo = git_project_factory().create("0.0.0")
+    # (the alias runs in a shell: the whole process group is terminated)
+    slow = ["-c", "alias.slow=!sleep 10", "slow"]
+
+    start = time.monotonic()
+    with pytest.raises(scm.GitTimeoutError):
+        repo.run(slow, timeout=0.2)
+    repo.timeouts["slow"] = 0.2
+    with pytest.raises(scm.GitTimeoutError):
+        repo(slow)
+    assert time.monotonic() - start < 5
+
+    cancel = threading.Event()
+    threading.Timer(0.2, cancel.set).start()
+    with pytest.raises(scm.GitCancelledError):
+        repo.run(slow, cancel=cancel)
+
+    async def cancelled():
+        task = asyncio.ensure_future(repo.arun(slow, timeout=0))
+        await asyncio.sleep(0.2)
+        task.cancel()
+        await task
+
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(cancelled())
+    assert time.monotonic() - start < 5
+
+    # the progress lines (\r or \n terminated), False aborts
+    lines = []
+    noisy = ["-c", "alias.noisy=!printf 'a 1\\ra 2\\nb\\n' >&2; echo out", "noisy"]
+    assert repo.run(noisy, progress=lines.append) == "out\n"
+    assert lines == ["a 1", "a 2", "b"]
+    noisy[1] += "; sleep 10"
+    with pytest.raises(scm.GitCancelledError):
+        repo.run(noisy, progress=lambda line: line != "b")
+
+    # the failures report the progress tail
+    with pytest.raises(subprocess.CalledProcessError) as exc:
+        repo.run(["-c", "alias.fail=!echo oops >&2; false", "fail"], progress=print)
+    assert exc.value.stderr == "oops"
+
+
+def test_lookup_ceiling(git_project_factory, monkeypatch):
+    repo = git_project_factory().create("0.0.0")
+    project = repo.workdir / "a" / "b"
+    (project / "c").mkdir(parents=True)
+
+    assert scm.lookup(project / "c").workdir == repo.workdir
+    assert scm.lookup(project / "c", ceiling=project) is None
+    assert scm.lookup(repo.workdir, ceiling=repo.workdir).workdir == repo.workdir
+
+    # git stops before entering the ceiling directories
+    monkeypatch.setenv("GIT_CEILING_DIRECTORIES", str(repo.workdir / "a"))
+    assert scm.lookup(project / "c") is None
+    assert scm.lookup(repo.workdir / "a").workdir == repo.workdir
+    monkeypatch.setenv("GIT_CEILING_DIRECTORIES", str(repo.workdir.parent))
+    assert scm.lookup(project / "c").workdir == repo.workdir
+
+
+BACKENDS = [
+    backend.name
+    for backend in scm.BACKENDS
+    if backend.name != "pygit2" or importlib.util.find_spec("pygit2")
+]
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_backend_conformance(git_project_factory, backend):
+    "all the backends return the same results"
+
+    klass = {b.name: b for b in scm.BACKENDS}[backend]
+
+    def check(repo):
+        srepo = scm.GitRepo(repo.workdir)
+        srepo.backends = [backend]
+
+        for operation in ["head", "branches", "references", "status"]:
+            if operation in klass.operations:
+                assert isinstance(srepo.backend(operation), klass)
+
+        if "head" in klass.operations:
+            assert srepo.head == repo.head
+            assert srepo.head.target.hex == repo(["rev-parse", "HEAD"]).strip()
+        if "branches" in klass.operations:
+            assert srepo.branches == repo.branches
+        if "references" in klass.operations:
+            assert srepo.references == repo.references
+        if "status" in klass.operations:
+            assert srepo.status() == repo.status()
+            assert srepo.status(untracked_files="no") == repo.status(
+                untracked_files="no"
+            )
+
+    upstream = git_project_factory().create("0.0.0")
+    upstream.branch("beta/0.0.0")
+    upstream(["tag", "-m", "release", "release/0.0.0"])
+
+    repo = git_project_factory().create(clone=upstream)
+    repo.backends = ["cli"]
+    repo.branch("beta/0.0.1", "origin/master")
+    repo(["tag", "release/0.0.1"])
+    check(repo)
+
+    # packed refs
+    repo(["pack-refs", "--all"])
+    repo.branch("beta/0.0.2", "origin/master")
+    check(repo)
+
+    # a dirty worktree
+    (repo.workdir / "untracked.txt").write_text("hello")
+    (repo.workdir / "a" / "b").mkdir(parents=True)
+    (repo.workdir / "a" / "b" / "deep.txt").write_text("hello")
+    (repo.workdir / "added.txt").write_text("hello")
+    repo(["add", "added.txt"])
+    repo.initfile.write_text("modified")
+    check(repo)
+    assert repo.status() == {
+        "a/b/deep.txt": 128,
+        "added.txt": 1,
+        "src/__init__.py": 256,
+        "untracked.txt": 128,
+    }
+    repo(["add", repo.initfile])
+    check(repo)
+    assert repo.status(untracked_files="no") == {"added.txt": 1, "src/__init__.py": 2}
+
+    # a detached HEAD
+    repo(["checkout", "-q", "--detach"])
+    srepo = scm.GitRepo(repo.workdir)
+    srepo.backends = [backend]
+    if "head" in klass.operations:
+        with pytest.raises(scm.GitError):
+            srepo.head  # noqa: B018
+
+    # a branch without commits
+    norepo = git_project_factory().create(nobranch=True)
+    srepo = scm.GitRepo(norepo.workdir)
+    srepo.backends = [backend]
+    if "head" in klass.operations:
+        with pytest.raises(scm.GitError):
+            srepo.head  # noqa: B018
+
+
+def test_select_backend(git_project_factory, monkeypatch):
+    repo = git_project_factory().create()
+    assert scm.select_backend(repo, "status", ["disk", "cli"]) is scm.CliBackend
+    assert scm.select_backend(repo, "head", ["disk", "cli"]) is scm.DiskBackend
+    with pytest.raises(scm.GitError):
+        scm.select_backend(repo, "status", ["disk"])
+
+    monkeypatch.setenv("SETUPTOOLS_GITHUB_BACKENDS", "cli")
+    assert scm.select_backend(repo, "head") is scm.CliBackend
+    monkeypatch.delenv("SETUPTOOLS_GITHUB_BACKENDS")
+
+    # the disk backend reads only the files ref storage
+    assert scm.DiskBackend(repo).ref_storage() == "files"
+    with (repo.gitdir / "config").open("a") as fp:
+        fp.write("[extensions]\n\trefStorage = reftable\n")
+    assert scm.DiskBackend(repo).ref_storage() == "reftable"
+    assert not scm.DiskBackend.available(repo)
+    assert scm.select_backend(repo, "head", ["disk", "cli"]) is scm.CliBackend
+
+
+def test_config(git_project_factory, tmp_path, monkeypatch):
+    system = tmp_path / "gitconfig"
+    monkeypatch.setenv("GIT_CONFIG_SYSTEM", str(system))
+    repo = git_project_factory().create("0.0.0")
+    repo(["config", "Foo.Bar.Baz", "1"])
+    repo(["config", "--add", "foo.Bar.baz", "2"])
+
+    config = scm.GitRepo(repo.workdir).config
+    assert "FOO.Bar.BAZ" in config
+    assert "foo.bar.baz" not in config  # the subsection is case sensitive
+    assert config["foo.Bar.baz"] == "2"
+    assert config.get_all("foo.Bar.baz") == ["1", "2"]
+    assert config.entries["user.name"][-1].scope == "local"
+    assert config.get("missing.key", "x") == "x"
+    with pytest.raises(KeyError):
+        config["missing.key"]
+
+    # loaded once, then reloaded when a config file changes
+    entries = config.entries
+    assert config.entries is entries
+    repo(["config", "foo.other", "yes"])
+    assert config["foo.other"] == "yes"
+
+    # update skips the unchanged values (a git config run per changed key)
+    assert config.update({"foo.other": "yes", "user.name": "Other"}) == ["user.name"]
+    assert repo(["config", "user.name"]).strip() == "Other"
+    assert config["user.name"] == "Other"
+
+    # the system config is tracked too
+    assert system in config.files()
+    system.write_text("[foo]\n\tsystem = yes\n")
+    assert config.entries["foo.system"][-1].scope == "system"
+
+
+def test_iter_branches(git_project_factory):
+    repo = git_project_factory().create("0.0.0")
+    for name in ["beta/0.0.0", "beta/0.0.1", "pkg/beta/0.0.0", "other"]:
+        repo(["branch", name])
+    sha = repo.rev_parse("HEAD")
+    repo(["update-ref", "refs/remotes/origin/beta/0.0.0", sha])
+    repo(["update-ref", "refs/remotes/up/beta/0.0.2", sha])
+    repo(["update-ref", "refs/notes/beta/0.0.0", sha])
+
+    branches = list(repo.iter_branches(["beta/0.0.0"]))
+    assert [b.name for b in branches] == ["beta/0.0.0", "origin/beta/0.0.0"]
+    assert [b.remote for b in branches] == [False, True]
+    assert {b.sha for b in branches} == {sha}
+
+    assert [b.name for b in repo.iter_branches(["beta/*"], remotes=["up"])] == [
+        "beta/0.0.0",
+        "beta/0.0.1",
+        "up/beta/0.0.2",
+    ]
+    assert [b.ref for b in repo.iter_branches(local=False)] == [
+        "refs/remotes/origin/beta/0.0.0",
+        "refs/remotes/up/beta/0.0.2",
+    ]
+    all_branches = repo.branches
+    assert [b.name for b in repo.iter_branches() if not b.remote] == sorted(
+        all_branches.local
+    )
+
+    # stopping early doesn't leave the git process around
+    iterator = repo.iter_branches()
+    next(iterator)
+    iterator.close()
+
+    index = repo.branch_index()
+    assert len(index) == 7
+    assert "refs/heads/beta/0.0.1" in index
+    assert "refs/heads/beta/0.0" not in index
+    assert index["refs/remotes/up/beta/0.0.2"] == sha
+    assert [b.name for b in index.prefix("refs/heads/beta/")] == [
+        "beta/0.0.0",
+        "beta/0.0.1",
+    ]
+    assert not list(index.prefix("refs/heads/zzz"))
+
+
+def test_dump_limit(git_project_factory):
+    repo = git_project_factory().create("0.0.0")
+    for index in range(5):
+        repo(["branch", f"beta/0.0.{index}"])
+    repo(["tag", "release/0.0.0"])
+
+    buf = io.StringIO()
+    repo.dump(buf, mask=True, limit={"branch": 2})
+    lines = buf.getvalue().split("\n")
+    start = lines.index(" [branch]")
+    assert lines[start + 1 : start + 4] == [
+        "    beta/0.0.0 ABCDEFG initial commit",
+        "    beta/0.0.1 ABCDEFG initial commit",
+        "  ... first 2 of 6 branches",
+    ]
+    assert lines[lines.index(" [tags]") + 1] == "  release/0.0.0"
+
+    # no limits, same as dumps
+    buf = io.StringIO()
+    repo.dump(buf, mask=True)
+    assert buf.getvalue() == repo.dumps(mask=True)
+
+
+def test_tree_hash(git_project_factory, monkeypatch):
+    repo = git_project_factory().create("0.0.0")
+    srcdir = repo.workdir / "src"
+    assert repo.tree_hash(srcdir) == repo.rev_parse("HEAD:src")
+    assert repo.tree_hash(repo.workdir) == repo.rev_parse("HEAD^{tree}")
+
+    # local changes (untracked files too) are included
+    (srcdir / "mod.py").write_text("x = 1\n")
+    (srcdir / "__init__.py").write_text('__version__ = "0.0.1"\n')
+    (repo.workdir / "other.txt").write_text("outside\n")
+    expected = repo.tree_hash(srcdir)
+    assert expected != repo.rev_parse("HEAD:src")
+
+    # the same from a subdirectory (eg. a monorepo package)
+    subdir = repo.workdir / "src"
+    monkeypatch.chdir(subdir)
+    assert repo.tree_hash(srcdir) == expected
+    monkeypatch.chdir(repo.workdir)
+
+    repo.commit([srcdir / "mod.py", srcdir / "__init__.py"], "change")
+    assert repo.rev_parse("HEAD:src") == expected
+
+
+def test_write_tree(git_project_factory, monkeypatch):
+    repo = git_project_factory().create("0.0.0")
+    script = repo.workdir / "src" / "run.sh"
+    script.write_text("#!/bin/sh\n")
+    script.chmod(0o755)
+    repo.commit(script, "a script")
+
+    # the modes are kept (from a subdirectory too)
+    monkeypatch.chdir(repo.workdir / "src")
+    newfile = repo.workdir.parent / "run.sh"
+    newfile.write_text("#!/bin/sh\necho hello\n")
+    tree = repo.write_tree("HEAD", {"src/run.sh": newfile})
+    assert repo(["ls-tree", tree, "--", ":(top)src/run.sh"]).startswith("100755 ")
+    assert repo(["cat-file", "blob", f"{tree}:src/run.sh"]) == newfile.read_text()
@@ -11,23 +11,37 @@ def errorfn(message, explain="", hint=""):
     raise MyError(message, explain, hint)
 
 
+def make_options(**kwargs):
+    "the default command line options, updated with kwargs"
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser()
+    script.add_arguments(parser)
+    defaults = {
+        action.dest: action.default
+        for action in parser._actions
+        if action.dest != "help"
+    }
+    return Namespace(**{**defaults, "error": errorfn, **kwargs})
+
+
 def test_add_arguments():
     from argparse import ArgumentParser
 
     parser = ArgumentParser()
     script.add_arguments(parser)
-    assert len(parser._actions) == 5  # all action + help action
+    assert len(parser._actions) == 21  # all action + help action
 
 
 def test_process_options(tmp_path, git_project_factory):
-    options = Namespace(workdir=tmp_path)
+    options = Namespace(workdir=tmp_path, mode="make-beta")
     try:
         script.process_options(options, error=errorfn)
     except MyError as e:
         assert e.args[0] == "no git directory"
 
     repo = git_project_factory().create(force=True, nobranch=True)
-    options = Namespace(workdir=repo.workdir)
+    options = Namespace(workdir=repo.workdir, mode="make-beta")
     try:
         script.process_options(options, error=errorfn)  # , error=error)
     except MyError as e:
@@ -37,11 +51,10 @@ def test_process_options(tmp_path, git_project_factory):
 def test_main_make_beta(git_project_factory):
     repo = git_project_factory().create(force=True)
 
-    options = Namespace(
+    options = make_options(
         initfile=repo.workdir / "src" / "__init__.py",
         repo=repo,
         mode="make-beta",
-        error=errorfn,
         master=None
     )
     try:
@@ -50,11 +63,10 @@ def test_main_make_beta(git_project_factory):
         assert exc.args[0].startswith("cannot find version file")
 
     repo = git_project_factory().create(version="0.0.0")
-    options = Namespace(
+    options = make_options(
         initfile=repo.workdir / "src" / "__init__.py",
         repo=repo,
         mode="make-beta",
-        error=errorfn,
         master="master"
     )
     script.main.__wrapped__(options)
@@ -73,11 +85,10 @@ def test_main_make_release(git_project_factory):
     old = repo.branch("beta/0.0.0", "master")
     repo(["checkout", old])
 
-    options = Namespace(
+    options = make_options(
         initfile=repo.workdir / "src" / "__init__.py",
         repo=repo,
         mode="micro",
-        error=errorfn,
         master="master"
     )
     try:
@@ -92,3 +103,202 @@ def test_main_make_release(git_project_factory):
         script.main.__wrapped__(options)
     except MyError as exc:
         assert exc.args[0].startswith("branch 'beta/0.0.0' already present")
+
+
+def test_main_fetch(git_project_factory):
+    upstream = git_project_factory().create(version="0.0.0")
+    upstream.branch("beta/0.0.0", "master")
+    upstream(["tag", "-m", "release", "release/0.0.0"])
+    upstream(["checkout", "master"])
+
+    repo = git_project_factory().create(clone=upstream)
+    repo(["tag", "-d", "release/0.0.0"])
+    repo(["branch", "-rd", "origin/beta/0.0.0"])
+
+    # offline: nothing is fetched, so beta/0.0.0 looks missing
+    options = make_options(
+        initfile=repo.initfile, repo=repo, mode="make-beta", fetch=False
+    )
+    script.main.__wrapped__(options)
+    assert set(repo.branches.remote) == {"origin/HEAD", "origin/master"}
+    repo(["checkout", "master"])
+    repo(["branch", "-D", "beta/0.0.0"])
+
+    # targeted fetch: the beta branches (but no tags) are fetched
+    options = make_options(initfile=repo.initfile, repo=repo, mode="make-beta")
+    try:
+        script.main.__wrapped__(options)
+    except MyError as exc:
+        assert exc.args[0] == "branch 'origin/beta/0.0.0' already present"
+    assert repo.references == []
+
+
+def test_main_release_plumbing(git_project_factory, capsys):
+    repo = git_project_factory().create(version="0.0.0")
+    repo.branch("beta/0.0.0", "master")
+    master = repo.rev_parse("master")
+
+    options = make_options(
+        initfile=repo.initfile, repo=repo, mode="minor", engine="plumbing"
+    )
+    script.main.__wrapped__(options)
+
+    assert repo.head.name == "refs/heads/beta/0.0.0"
+    assert repo(["show", "master:src/__init__.py"]) == '__version__ = "0.1.0"\n'
+    err = capsys.readouterr().err
+    assert f"git update-ref refs/heads/master {master}" in err
+    assert "git update-ref -d refs/tags/release/0.0.0" in err
+
+
+def test_main_monorepo(git_project_factory, capsys):
+    repo = git_project_factory().create()
+    initfiles = []
+    for name, version in [("pkg_a", "0.1.0"), ("pkg_b", "1.0.0")]:
+        initfile = repo.workdir / "src" / name / "__init__.py"
+        initfile.parent.mkdir(parents=True)
+        initfile.write_text(f'__version__ = "{version}"\n')
+        initfiles.append(initfile)
+    manifest = repo.workdir / "packages.txt"
+    manifest.write_text("# all the packages\nsrc/pkg_a/__init__.py\n")
+    repo.commit([*initfiles, manifest], "add packages")
+
+    options = make_options(
+        initfiles=initfiles[1:], manifest=manifest, repo=repo, mode="make-beta"
+    )
+    script.main.__wrapped__(options)
+    assert repo.head.name == "refs/heads/master"
+    assert set(repo.branches.local) == {
+        "master",
+        "pkg_a/beta/0.1.0",
+        "pkg_b/beta/1.0.0",
+    }
+
+    try:
+        script.main.__wrapped__(options)
+    except MyError as exc:
+        assert exc.args[0] == "branch 'pkg_b/beta/1.0.0' already present"
+
+    # a fix on a beta branch is released
+    repo(["checkout", "-q", "pkg_a/beta/0.1.0"])
+    fix = initfiles[0].parent / "fix.py"
+    fix.write_text("FIXED = True\n")
+    repo.commit(fix, "a fix")
+    repo(["checkout", "-q", "master"])
+    assert not fix.exists()
+
+    options.mode = "minor"
+    script.main.__wrapped__(options)
+    assert repo.references == [
+        "refs/tags/pkg_a/release/0.1.0",
+        "refs/tags/pkg_b/release/1.0.0",
+    ]
+    for package in ["pkg_a/beta/0.1.0", "pkg_b/beta/1.0.0"]:
+        tag = package.replace("/beta/", "/release/")
+        assert repo.rev_parse(f"{tag}^{{commit}}") == repo.rev_parse(package)
+        assert repo.is_ancestor(package, "master")
+    assert repo(["log", "-1", "--format=%B", "master"]).strip() == """\
+version bump
+
+pkg_b: 1.0.0 -> 1.1.0
+pkg_a: 0.1.0 -> 0.2.0"""
+    assert initfiles[0].read_text() == '__version__ = "0.2.0"\n'
+    assert fix.read_text() == "FIXED = True\n"
+    assert repo(["show", "master:src/pkg_b/__init__.py"]) == '__version__ = "1.1.0"\n'
+    assert not repo.status(untracked_files="no")
+
+    err = capsys.readouterr().err
+    assert "pkg_a  0.1.0 -> 0.2.0" in err
+    assert "git update-ref -d refs/tags/pkg_b/release/1.0.0" in err
+
+    # the beta branches must be there
+    options.initfiles, options.manifest = initfiles, None
+    try:
+        script.main.__wrapped__(options)
+    except MyError as exc:
+        assert exc.args[0] == "cannot find branch 'pkg_a/beta/0.2.0'"
+
+
+def test_main_report(git_project_factory, capsys):
+    import json
+
+    repo = git_project_factory().create(version="0.0.1")
+    repo1 = git_project_factory().create(version="1.0.0")
+
+    options = make_options(initfiles=[repo.initfile, repo1.initfile], mode="report")
+    script.main.__wrapped__(options)
+    found = {
+        data["version_file"]: data["data"]["version"]
+        for data in map(json.loads, capsys.readouterr().out.strip().split("\n"))
+    }
+    assert found == {str(repo.initfile): "0.0.1", str(repo1.initfile): "1.0.0"}
+
+
+def test_main_maintain(git_project_factory, capsys):
+    repo = git_project_factory().create(version="0.0.1")
+    repo.branch("beta/0.0.1", "master")
+    repo(["repack", "-q", "-d"])
+
+    options = make_options(workdir=repo.workdir, mode="maintain", midx=True)
+    options = script.process_options(options, options.error)
+    script.main.__wrapped__(options)
+
+    gitdir = repo.workdir / ".git"
+    assert (gitdir / "objects" / "info" / "commit-graph").exists()
+    assert "refs/heads/beta/0.0.1" in (gitdir / "packed-refs").read_text()
+    assert not (gitdir / "refs" / "heads" / "beta" / "0.0.1").exists()
+    assert repo(["config", "core.untrackedCache"]).strip() == "true"
+
+    err = capsys.readouterr().err
+    assert "pack-refs --all" in err
+    assert "multi-pack-index write" in err
+    for name in ["symbolic-ref", "rev-parse", "status", "branch", "tag"]:
+        assert f"\n    {name} " in err
+
+
+def test_main_changelog(git_project_factory, capsys):
+    repo = git_project_factory().create(version="0.0.1")
+    repo(["tag", "-a", "-m", "release", "release/0.0.1"])
+
+    options = make_options(workdir=repo.workdir, mode="changelog")
+    options = script.process_options(options, options.error)
+    script.main.__wrapped__(options)
+    assert capsys.readouterr().out.startswith("## release/0.0.1\n\n- initial commit")
+
+
+def test_main_update_context(git_project_factory):
+    from setuptools_github import hooks
+
+    repo = git_project_factory().create(version="0.0.1")
+    repo.branch("beta/0.0.1", "master")
+
+    options = make_options(
+        workdir=repo.workdir, initfiles=[repo.initfile], mode="update-context"
+    )
+    options = script.process_options(options, options.error)
+    script.main.__wrapped__(options)
+    assert hooks.read_context(repo.initfile)["version"] == "0.0.1b0"
+
+
+def test_main_watch(git_project_factory, monkeypatch):
+    from setuptools_github import watch
+
+    repo = git_project_factory().create(version="0.0.1")
+    found = {}
+    monkeypatch.setattr(
+        watch, "watch", lambda watcher, poll: found.update(vars(watcher))
+    )
+
+    options = make_options(
+        workdir=repo.workdir,
+        initfiles=[repo.initfile],
+        mode="watch",
+        templates=[repo.workdir / "README.md"],
+        outdir=repo.workdir / "build",
+        fixers=["[master]={{ ctx.branch }}"],
+    )
+    options = script.process_options(options, options.error)
+    script.main.__wrapped__(options)
+    assert found["fixers"] == {"[master]": "{{ ctx.branch }}"}
+    assert found["targets"] == {
+        repo.workdir / "README.md": repo.workdir / "build" / "README.md"
+    }
@@ -1,5 +1,6 @@
 # ruff: noqa: E501
 import json
+import sys
 
 import pytest
 from setuptools_github import tools
@@ -469,3 +470,228 @@ Key[version] = 1.2.3b0
 Key[workflow] = beta
 """
     )
+
+
+def test_local_build_number(git_project_factory):
+    repo = git_project_factory().create("0.0.0")
+    assert not (repo.workdir / ".git" / "objects" / "info" / "commit-graph").exists()
+
+    # on master, all the commits (no release tags yet)
+    count = int(repo(["rev-list", "--count", "HEAD"]))
+    assert tools.local_build_number(repo) == count
+    assert (repo.workdir / ".git" / "objects" / "info" / "commit-graph").exists()
+
+    repo.branch("beta/0.0.0", "master")
+    assert tools.local_build_number(repo) == 0
+    for index in range(3):
+        path = repo.workdir / f"file{index}.txt"
+        path.write_text(f"{index}\n")
+        repo.commit(path, f"beta commit {index}")
+        assert tools.local_build_number(repo) == index + 1
+
+    # memoized by (base, head)
+    memo = repo.workdir / ".git" / "setuptools-github-counts.json"
+    assert len(json.loads(memo.read_text())) == 5
+
+    data = tools.get_data(repo.initfile, repo=repo, local_build=True)[0]
+    assert data["version"] == "0.0.0b3"
+
+    # after a release tag
+    repo(["tag", "-a", "-m", "release", "release/0.0.0"])
+    path = repo.workdir / "more.txt"
+    path.write_text("more\n")
+    repo.commit(path, "more")
+    repo(["checkout", "-q", "-b", "other"])
+    assert tools.local_build_number(repo) == 1
+
+
+def test_get_data_tree_hash(git_project_factory):
+    repo = git_project_factory().create("0.0.0")
+    assert "tree" not in tools.get_data(repo.initfile, repo=repo)[0]
+
+    data = tools.get_data(repo.initfile, repo=repo, tree_hash=True)[0]
+    assert data["tree"] == repo.rev_parse("HEAD:src")
+
+    data = tools.process(repo.initfile, repo=repo, tree_hash=True)
+    record = (repo.initfile.parent / "_build.py").read_text()
+    assert f"tree = '{data['tree']}'" in record
+
+
+def test_process_context(git_project_factory, monkeypatch):
+    repo = git_project_factory().create("1.2.3")
+    repo(["tag", "-a", "-m", "release", "release/1.2.2", "HEAD~1"])
+
+    calls = []
+
+    def expensive(ctx):
+        calls.append(ctx.version)
+        return "computed"
+
+    monkeypatch.setitem(tools.CONTEXT_PROVIDERS, "expensive", expensive)
+
+    tfiles = [repo.workdir / "a.txt", repo.workdir / "b.txt"]
+    for tfile in tfiles:
+        tfile.write_text(
+            "{{ ctx.expensive }} {{ ctx.last_tag }} {{ ctx.commit_count }} "
+            "{{ ctx.changelog | join(',') }} {{ ctx.contributors | join(',') }}"
+        )
+    (repo.workdir / "plain.txt").write_text("{{ ctx.version }}")
+
+    tools.process(repo.initfile, None, None, [*tfiles, repo.workdir / "plain.txt"])
+    for tfile in tfiles:
+        assert tfile.read_text() == (
+            "computed release/1.2.2 1 initial commit First Last"
+        )
+    assert calls == ["1.2.3"]  # computed once for all the files
+
+    # the lazy attributes are not listed
+    ctx = tools.BuildContext({"version": "1.2.3"}, repo.initfile)
+    assert dict(ctx.items()) == {"version": "1.2.3"}
+    assert ctx.dirty == ["src/__init__.py"]
+    with pytest.raises(AttributeError):
+        ctx.missing  # noqa: B018
+
+
+def test_process_plain(git_project_factory, monkeypatch):
+    repo = git_project_factory().create("1.2.3")
+
+    def jinja_env():
+        raise AssertionError("jinja2 not needed")
+
+    monkeypatch.setattr(tools, "jinja_env", jinja_env)
+
+    # no template syntax (after the fixers): written as is, no jinja2
+    tfile = repo.workdir / "README.md"
+    tfile.write_text("# Title <a>\n\nbranch: BRANCH\n\n")
+    tools.process(repo.initfile, None, None, tfile, fixers={"BRANCH": "master"})
+    assert tfile.read_text() == "# Title <a>\n\nbranch: master\n\n"
+
+    assert tools.is_template("{{ ctx.version }}")
+    assert tools.is_template("{% if x %}{% endif %}")
+    assert tools.is_template("{# comment #}")
+    assert not tools.is_template("{ x } %} }}")
+
+
+def test_process_stable(git_project_factory, monkeypatch):
+    repo = git_project_factory().create("1.2.3")
+    record = repo.initfile.parent / "_build.py"
+
+    with pytest.raises(tools.ToolsError):
+        tools.process(repo.initfile, None, None, stable=True)
+
+    # the accessor is added once
+    data = tools.process(repo.initfile, stable=True)
+    assert tools.get_module_var(repo.initfile) == "1.2.3"
+    assert "def __getattr__(name):" in repo.initfile.read_text()
+    assert data["sha"] == repo.rev_parse("HEAD")
+    assert f"sha = '{repo.rev_parse('HEAD')}'" in record.read_text()
+    repo.commit(repo.initfile, "the accessor")
+    before = repo.initfile.read_bytes()
+
+    # a new commit: only the record changes
+    (repo.workdir / "a.txt").write_text("a")
+    repo.commit(repo.workdir / "a.txt", "a new file")
+    mtime = repo.initfile.stat().st_mtime_ns
+    data = tools.process(repo.initfile, stable=True)
+    assert repo.initfile.stat().st_mtime_ns == mtime
+    assert data["sha"] == repo.rev_parse("HEAD")
+    assert f"sha = '{repo.rev_parse('HEAD')}'" in record.read_text()
+
+    # the record is left alone if unchanged
+    mtime = record.stat().st_mtime_ns
+    tools.process(repo.initfile, stable=True)
+    assert record.stat().st_mtime_ns == mtime
+
+    # without a repo (eg. an unpacked sdist) the record is the source
+    import shutil
+
+    sdist = repo.workdir.parent / "sdist"
+    shutil.copytree(repo.initfile.parent, sdist)
+    assert tools.process(sdist / "__init__.py", stable=True) == data
+
+    # a beta build leaves the version file alone too
+    gdata = {**GITHUB["beta"], "ref": "refs/heads/beta/1.2.3"}
+    data = tools.process(repo.initfile, json.dumps(gdata), stable=True)
+    assert data["version"] == "1.2.3b98"
+    assert repo.initfile.read_bytes() == before
+
+    # the record values are served lazily
+    from importlib.util import module_from_spec, spec_from_file_location
+
+    spec = spec_from_file_location(
+        "stable_pkg", repo.initfile, submodule_search_locations=[str(record.parent)]
+    )
+    module = module_from_spec(spec)
+    monkeypatch.setitem(sys.modules, "stable_pkg", module)
+    spec.loader.exec_module(module)
+    assert "stable_pkg._build" not in sys.modules
+    assert module.__version__ == "1.2.3"
+    assert module.version == "1.2.3b98"
+    assert module.sha == data["sha"]
+    assert not hasattr(module, "missing")
+    monkeypatch.delitem(sys.modules, "stable_pkg._build")
+
+
+def test_process_outdir(git_project_factory, monkeypatch):
+    repo = git_project_factory().create("1.2.3")
+    sources = [repo.workdir / "README.md", repo.workdir / "docs" / "index.md"]
+    sources[1].parent.mkdir()
+    for source in sources:
+        source.write_text("branch [master] {{ ctx.version }}\n")
+    outdir = repo.workdir / "build"
+
+    assert tools.output_paths(sources, outdir) == {
+        sources[0]: outdir / "README.md",
+        sources[1]: outdir / "docs" / "index.md",
+    }
+
+    fixers = {"[master]": "[{{ ctx.branch }}]"}
+    tools.process(repo.initfile, None, None, sources, fixers, outdir=outdir)
+    assert sources[0].read_text() == "branch [master] {{ ctx.version }}\n"
+    assert (outdir / "README.md").read_text() == "branch [master] 1.2.3"
+    assert (outdir / "docs" / "index.md").read_text() == "branch [master] 1.2.3"
+    assert set(tools.read_manifest(outdir)) == {"README.md", "docs/index.md"}
+
+    # unchanged sources (and data) are skipped
+    # (the first process call dirtied the tree, changing the sha)
+    tools.process(repo.initfile, None, None, sources, fixers, outdir=outdir)
+    rendered = []
+    render = tools.jinja_env
+
+    def counted():
+        rendered.append(1)
+        return render()
+
+    monkeypatch.setattr(tools, "jinja_env", counted)
+    tools.process(repo.initfile, None, None, sources, fixers, outdir=outdir)
+    assert not rendered
+
+    sources[1].write_text("changed {{ ctx.version }}")
+    tools.process(repo.initfile, None, None, sources, fixers, outdir=outdir)
+    assert rendered == [1]
+    assert (outdir / "docs" / "index.md").read_text() == "changed 1.2.3"
+
+
+def test_get_data_no_lookup(git_project_factory, monkeypatch):
+    from setuptools_github import scm
+
+    repo = git_project_factory().create("0.3.10")
+    record = repo.initfile.parent / "_build.py"
+    tools.process(repo.initfile, json.dumps(GITHUB["beta"]), record)
+
+    def nolookup(*args, **kwargs):
+        raise AssertionError("scm.lookup called")
+
+    # a github dump or a record don't need the repo
+    monkeypatch.setattr(scm, "lookup", nolookup)
+    data = tools.get_data(repo.initfile, json.dumps(GITHUB["beta"]))[0]
+    assert data["build"] == "98"
+    assert tools.get_data(repo.initfile, None, record)[0]["version"] == "0.3.10b98"
+    with pytest.raises(AssertionError):
+        tools.get_data(repo.initfile)
+
+    # the ceiling keeps the lookup in the project
+    monkeypatch.undo()
+    assert tools.get_data(repo.initfile)[0]["sha"]
+    data = tools.get_data(repo.initfile, ceiling=repo.initfile.parent, abort=False)[0]
+    assert data["sha"] is None
@@ -0,0 +1,84 @@
+import threading
+
+import pytest
+
+from setuptools_github import tools, watch
+
+
+def test_refresh(git_project_factory):
+    repo = git_project_factory().create("0.0.0")
+    badge = repo.workdir / "badge.txt"
+    badge.write_text("version {{ ctx.version }} on [master]\n")
+    other = repo.workdir / "other.txt"
+    other.write_text("static\n")
+    repo.commit([badge, other], "the templates")
+    before = repo.initfile.read_bytes()
+    outdir = repo.workdir.parent / "out"
+    record = repo.initfile.parent / "_build.py"
+
+    with pytest.raises(tools.ToolsError):
+        watch.Watcher(repo.initfile, [badge, other])
+
+    fixers = {"[master]": "{{ ctx.branch }}"}
+    watcher = watch.Watcher(repo.initfile, [badge, other], fixers=fixers, outdir=outdir)
+    targets = [outdir / "badge.txt", outdir / "other.txt"]
+    assert set(watcher.refresh()) == {record, *targets}
+    assert targets[0].read_text() == "version 0.0.0 on master"
+
+    # nothing changed
+    assert watcher.refresh() == []
+
+    # the tracked files are left alone: a branch switch works
+    assert not repo.status(untracked_files="no")
+    repo(["checkout", "-q", "-b", "beta/0.0.0"])
+    assert watcher.refresh() == [record, outdir / "badge.txt"]
+    assert (outdir / "badge.txt").read_text() == "version 0.0.0b0 on beta/0.0.0"
+    assert tools.loadmod(record).version == "0.0.0b0"
+    assert repo.initfile.read_bytes() == before
+
+    # editing a template renders it again
+    other.write_text("{{ ctx.current }}\n")
+    assert watcher.refresh() == [outdir / "other.txt"]
+    assert (outdir / "other.txt").read_text() == "0.0.0"
+
+
+def test_watched_worktree(git_project_factory):
+    "a linked worktree: HEAD and the index in its gitdir, the refs in the main one"
+    repo = git_project_factory().create("0.0.0")
+    linked = repo.workdir.parent / "linked"
+    repo(["worktree", "add", "-q", "-b", "beta/0.0.0", linked])
+
+    watcher = watch.Watcher(linked / repo.initfile.relative_to(repo.workdir))
+    gitdir = repo.workdir / ".git"
+    watched = watcher.watched()
+    assert gitdir / "worktrees" / "linked" in watched
+    assert gitdir in watched
+    assert gitdir / "refs" / "heads" / "beta" in watched
+
+
+@pytest.mark.parametrize("poll", [0, 0.05])
+def test_watch(git_project_factory, poll):
+    repo = git_project_factory().create("0.0.0")
+    watcher = watch.Watcher(repo.initfile)
+
+    done = threading.Event()
+    updates = []
+
+    def callback(written):
+        updates.append(written)
+        if len(updates) == 2:
+            done.set()
+
+    thread = threading.Thread(
+        target=watch.watch, args=(watcher, poll, done.is_set, callback)
+    )
+    thread.start()
+    try:
+        while not updates:
+            done.wait(0.01)
+        repo(["checkout", "-q", "-b", "beta/0.0.0"])
+        assert done.wait(5)
+    finally:
+        done.set()
+        thread.join(5)
+    assert tools.loadmod(watcher.record_path).version == "0.0.0b0"